@@ -1,9 +1,24 @@
 import asyncio
-from pyppeteer.launcher import Launcher, launch
+import time
+from http.cookies import SimpleCookie
+from typing import List, Optional
+
+from aiohttp import ClientSession
+from yarl import URL
+
+from credentials import CredentialCache
+from tokens import expiry
+
+LOGIN = 'censored'
+NBA_TOKEN = 'censored'
+FLOW_TOKEN = 'censored'
 
 
 class Account:
-    def __init__(self, username: str, password: str, secret: str = None):
+    def __init__(
+        self, username: str, password: str, secret: str = None,
+        profile: str = None, cache: CredentialCache = None, margin: float = 60.0
+    ):
         self.username = username
         self.password = password
         self.secret = secret
@@ -14,42 +29,123 @@ class Account:
         #     parsed = urlparse(proxy)
         #     arguments = [f'--proxy-server={parsed.hostname}:{parsed.port}']
         #     self.proxy = {'username': parsed.username, 'password': parsed.password}
-        self.launcher = Launcher(ignoreDefaultArgs=True)
+        self.profile = profile
+        self.cache = cache
+        self.margin = margin
+        self.browser = None
+        self.http: Optional[ClientSession] = None
+        self.cookies: List[dict] = []
+        self.tokens = {'nba': '', 'flow': ''}
+        self.login = None
 
     async def __aenter__(self):
-        self.browser = await self.launcher.launch()
+        cached = self.cache.load() if self.cache is not None else None
+        if cached is not None:
+            self.cookies = cached.get('cookies', [])
+            self.tokens.update(cached.get('tokens', {}))
+        self.http = ClientSession()
+        self.load_cookies(self.cookies)
+        return self
+
+    def load_cookies(self, cookies: List[dict]):
+        for it in cookies:
+            domain = it.get('domain') or ''
+            if not domain:
+                continue
+            cookie = SimpleCookie()
+            cookie[it['name']] = it['value']
+            cookie[it['name']]['domain'] = domain
+            cookie[it['name']]['path'] = it.get('path') or '/'
+            self.http.cookie_jar.update_cookies(cookie, response_url=URL('https://' + domain.lstrip('.')))
+
+    def fresh(self, token: str) -> bool:
+        expires = expiry(token)
+        return expires is not None and expires - self.margin > time.time()
+
+    async def launch(self):
+        from pyppeteer.launcher import Launcher
+        options = {'ignoreDefaultArgs': True}
+        if self.profile is not None:
+            options['userDataDir'] = self.profile
+        self.browser = await Launcher(**options).launch()
         page = (await self.browser.pages())[0]
-        await page.goto('censored')
-        login = await page.waitFor('svg[viewBox="0 0 202 44"]')
-        await login.asElement().click()
-        first = (await page.waitFor('input[type="email"]')).asElement()
-        await first.type(self.username)
-        await first.press('Enter')
-        second = (await page.waitFor('input[type="password"]')).asElement()
-        await asyncio.sleep(2)
-        await second.type(self.password)
-        await second.press('Enter')
-        await page.waitFor('a[href="/"]')
+        await page.goto(LOGIN)
+        await page.waitFor('svg[viewBox="0 0 202 44"], a[href="/"]')
+        login = await page.querySelector('svg[viewBox="0 0 202 44"]')
+        if login is not None:
+            await login.click()
+            first = (await page.waitFor('input[type="email"]')).asElement()
+            await first.type(self.username)
+            await first.press('Enter')
+            second = (await page.waitFor('input[type="password"]', {'visible': True})).asElement()
+            await second.type(self.password)
+            await second.press('Enter')
+            await page.waitFor('a[href="/"]')
         await page.goto('https://accounts.meetdapper.com')
         self.flow = await self.browser.newPage()
         self.nba = await self.browser.newPage()
-        await self.flow.goto('censored')
-        await self.nba.goto('censored')
+        await self.flow.goto(FLOW_TOKEN)
+        await self.nba.goto(NBA_TOKEN)
         await page.close()
-        return self
+
+    async def ensure_browser(self):
+        if self.login is None:
+            self.login = asyncio.ensure_future(self.launch())
+        try:
+            await self.login
+        except Exception:
+            self.login = None
+            raise
+
+    async def direct(self, url: str, field: str) -> Optional[str]:
+        if not self.cookies:
+            return None
+        try:
+            async with self.http.get(url) as response:
+                if response.status != 200:
+                    return None
+                return (await response.json())[field]
+        except Exception as reason:
+            print(f'Direct refresh failed: {reason}')
+            return None
+
+    async def browser_token(self, page: str, field: str) -> str:
+        await self.ensure_browser()
+        response = await getattr(self, page).reload()
+        token = (await response.json())[field]
+        cookies = await getattr(self, page).cookies()
+        merged = {(it['name'], it.get('domain')): it for it in self.cookies + cookies}
+        self.cookies = list(merged.values())
+        self.load_cookies(cookies)
+        return token
+
+    async def token(self, name: str, url: str, page: str, field: str) -> str:
+        token = self.tokens[name]
+        if not self.fresh(token):
+            token = await self.direct(url, field)
+            if token is None:
+                token = await self.browser_token(page, field)
+            self.tokens[name] = token
+            self.save()
+        return token
+
+    def save(self):
+        if self.cache is not None:
+            self.cache.save({'cookies': self.cookies, 'tokens': self.tokens})
 
     async def nba_token(self):
-        response = await self.nba.reload()
-        return (await response.json())['idToken']
+        return await self.token('nba', NBA_TOKEN, 'nba', 'idToken')
 
     async def flow_token(self):
-        response = await self.flow.reload()
-        return (await response.json())['accessToken']
+        return await self.token('flow', FLOW_TOKEN, 'flow', 'accessToken')
 
     async def __aexit__(self, exc_type, exc_val, exc_tb):
         await self.close()
 
     async def close(self):
-        for page in await self.browser.pages():
-            await page.close()
-        await self.browser.close()
+        if self.browser is not None:
+            for page in await self.browser.pages():
+                await page.close()
+            await self.browser.close()
+        if self.http is not None:
+            await self.http.close()
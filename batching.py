@@ -0,0 +1,106 @@
+import asyncio
+from typing import Awaitable, Callable, List, Set, Tuple
+
+from metrics import logger
+
+
+class BatchRejected(Exception):
+    pass
+
+
+Entry = Tuple[bytes, str, int, asyncio.Future]
+
+
+def unsupported(data: dict) -> bool:
+    errors = data.get('errors') or [data.get('error')]
+    return any('batch' in str(error).lower() for error in errors if error)
+
+
+class Batcher:
+    def __init__(
+        self, send: Callable[[bytes, str, int], Awaitable[dict]],
+        send_many: Callable[[List[bytes], List[str], int], Awaitable[List[dict]]],
+        size: int = 16, window: float = 0.005
+    ):
+        self.send = send
+        self.send_many = send_many
+        self.size = size
+        self.window = window
+        self.pending: List[Entry] = []
+        self.timer = None
+        self.tasks: Set[asyncio.Task] = set()
+        self.requests = 0
+        self.operations = 0
+
+    async def submit(self, body: bytes, name: str, rank: int = 0) -> dict:
+        if self.size <= 1:
+            return await self.send(body, name, rank)
+        loop = asyncio.get_event_loop()
+        future = loop.create_future()
+        self.pending.append((body, name, rank, future))
+        if len(self.pending) >= self.size:
+            self.flush()
+        elif self.timer is None:
+            self.timer = loop.call_later(self.window, self.flush)
+        return await future
+
+    def flush(self):
+        if self.timer is not None:
+            self.timer.cancel()
+            self.timer = None
+        batch, self.pending = self.pending, []
+        if batch:
+            task = asyncio.ensure_future(self.dispatch(batch))
+            self.tasks.add(task)
+            task.add_done_callback(self.tasks.discard)
+
+    async def dispatch(self, batch: List[Entry]):
+        batch = [entry for entry in batch if not entry[3].done()]
+        if not batch:
+            return
+        if len(batch) == 1 or self.size <= 1:
+            await asyncio.gather(*map(self.single, batch))
+            return
+        self.requests += 1
+        self.operations += len(batch)
+        try:
+            results = await self.send_many(
+                [body for body, _, _, _ in batch], [name for _, name, _, _ in batch],
+                min(rank for _, _, rank, _ in batch)
+            )
+        except BatchRejected as reason:
+            self.size = min(self.size, len(batch) // 2)
+            logger.info('batch of %d rejected, limiting to %d: %s', len(batch), self.size, reason)
+            for _, _, _, future in batch:
+                if not future.done():
+                    future.set_exception(reason)
+            return
+        except asyncio.CancelledError:
+            for _, _, _, future in batch:
+                future.cancel()
+            raise
+        except Exception as reason:
+            for _, _, _, future in batch:
+                if not future.done():
+                    future.set_exception(reason)
+            return
+        for (_, _, _, future), result in zip(batch, results):
+            if not future.done():
+                future.set_result(result)
+
+    async def single(self, entry: Entry):
+        body, name, rank, future = entry
+        try:
+            result = await self.send(body, name, rank)
+        except Exception as reason:
+            if not future.done():
+                future.set_exception(reason)
+            return
+        if not future.done():
+            future.set_result(result)
+
+    async def close(self):
+        self.flush()
+        for task in list(self.tasks):
+            task.cancel()
+        await asyncio.gather(*self.tasks, return_exceptions=True)
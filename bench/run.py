@@ -0,0 +1,165 @@
+import argparse
+import asyncio
+import json
+import os
+import resource
+import subprocess
+import time
+
+from bench.server import StandIn
+from bot import Bot, Moment
+from captcha import FakeSolver
+from engine import TradeEngine
+from relist import Relister
+from session import Session
+
+RESULTS = os.path.join(os.path.dirname(__file__), 'results')
+
+
+async def no_token() -> str:
+    return ''
+
+
+async def connect(session: Session, url: str, period: float, combine: int = 0) -> Bot:
+    return Bot(
+        period=period,
+        solve_recaptcha=FakeSolver().solve,
+        call_nba=await session.create_caller(
+            url, 'x-id-token', no_token, cached=False, batch=combine > 1, size=combine
+        ),
+        call_flow=await session.create_caller(url, 'Authorization', no_token, cached=False),
+        metrics=session.metrics
+    )
+
+
+async def sweep(bot: Bot, standin: StandIn, concurrency: int) -> dict:
+    started = time.monotonic()
+    plays = moments = 0
+    async for _, listings in bot.scan(bot.iter_plays(batch=75), concurrency=concurrency):
+        plays += 1
+        moments += len(listings)
+    elapsed = time.monotonic() - started
+    return {'seconds': elapsed, 'plays': plays, 'moments': moments, 'plays_per_second': plays / elapsed}
+
+
+async def collection(bot: Bot, standin: StandIn, batch: int) -> dict:
+    started = time.monotonic()
+    count = 0
+    async for _ in bot.iter_collection('owner', batch):
+        count += 1
+    elapsed = time.monotonic() - started
+    return {'seconds': elapsed, 'moments': count, 'moments_per_second': count / elapsed}
+
+
+async def resell(bot: Bot, standin: StandIn, trades: int) -> dict:
+    engine = TradeEngine(bot)
+    plays = [play async for play in bot.iter_plays(batch=75, cap=trades)]
+    candidates = [(await bot.get_moments(play))[0] for play in plays]
+
+    async def timed(moment: Moment) -> float:
+        started = time.monotonic()
+        await engine.trade(moment, 1)
+        return time.monotonic() - started
+    started = time.monotonic()
+    latencies = sorted(await asyncio.gather(*map(timed, candidates)))
+    return {
+        'seconds': time.monotonic() - started,
+        'trades': len(latencies),
+        'median': latencies[len(latencies) // 2],
+        'max': latencies[-1],
+    }
+
+
+async def relist(bot: Bot, session: Session, standin: StandIn, count: int) -> dict:
+    relister = Relister(bot, lambda moment: 10, path=':memory:', concurrency=32, limiter=session.limiter)
+    await relister.load(bot.iter_collection('owner', 1000, cap=count))
+    await relister.run(idle=0.05)
+    return {
+        'seconds': time.monotonic() - relister.started,
+        'listed': relister.listed,
+        'failed': relister.failed,
+        'listings_per_hour': relister.hourly,
+    }
+
+
+async def benchmark(args) -> dict:
+    standin = StandIn(
+        plays=args.plays, listings=args.listings, collection=args.collection,
+        latency=args.latency, jitter=args.jitter, limited=args.limited,
+        flared=args.flared, throttled=args.throttled, batching=not args.unbatched
+    )
+    url = await standin.start()
+    results = {}
+    try:
+        async with Session('') as session:
+            bot = await connect(session, url, period=args.period, combine=args.combine)
+            for name, run in (
+                ('sweep', lambda: sweep(bot, standin, args.concurrency)),
+                ('collection', lambda: collection(bot, standin, args.batch)),
+                ('resell', lambda: resell(bot, standin, args.trades)),
+                ('relist', lambda: relist(bot, session, standin, args.relists)),
+            ):
+                if name in args.only:
+                    before = standin.requests
+                    results[name] = await run()
+                    results[name]['requests'] = standin.requests - before
+                    print(name, json.dumps(results[name]))
+            results['metrics'] = session.metrics.snapshot()
+    finally:
+        await standin.stop()
+    results['max_rss_kb'] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return results
+
+
+def revision() -> str:
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], text=True).strip()
+    except Exception:
+        return 'unknown'
+
+
+def compare(current: dict, previous: dict):
+    for name in ('sweep', 'collection', 'resell', 'relist'):
+        if name in current and name in previous:
+            before = previous[name]['seconds']
+            after = current[name]['seconds']
+            print(f'{name}: {before:.2f}s -> {after:.2f}s ({(after - before) / before * 100:+.1f}%)')
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--only', nargs='+', default=['sweep', 'collection', 'resell', 'relist'])
+    parser.add_argument('--plays', type=int, default=2000)
+    parser.add_argument('--listings', type=int, default=20)
+    parser.add_argument('--collection', type=int, default=1000000)
+    parser.add_argument('--batch', type=int, default=1000)
+    parser.add_argument('--trades', type=int, default=20)
+    parser.add_argument('--relists', type=int, default=200)
+    parser.add_argument('--concurrency', type=int, default=16)
+    parser.add_argument('--combine', type=int, default=0)
+    parser.add_argument('--unbatched', action='store_true')
+    parser.add_argument('--period', type=float, default=0.05)
+    parser.add_argument('--latency', type=float, default=0.02)
+    parser.add_argument('--jitter', type=float, default=0.01)
+    parser.add_argument('--limited', type=float, default=0.0)
+    parser.add_argument('--flared', type=float, default=0.0)
+    parser.add_argument('--throttled', type=float, default=0.0)
+    parser.add_argument('--label', default=None)
+    parser.add_argument('--compare', default=None)
+    args = parser.parse_args()
+
+    results = asyncio.run(benchmark(args))
+    results['revision'] = revision()
+    results['arguments'] = vars(args)
+    os.makedirs(RESULTS, exist_ok=True)
+    path = os.path.join(RESULTS, f'{args.label or results["revision"]}.json')
+    with open(path, 'w') as file:
+        json.dump(results, file, indent=2)
+    print(f'Saved {path}')
+    if args.compare:
+        with open(args.compare) as file:
+            compare(results, json.load(file))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,197 @@
+import asyncio
+import os
+import random
+import uuid
+from typing import Dict
+
+from aiohttp import web
+
+import bot
+from operations import Registry
+
+
+class StandIn:
+    def __init__(
+        self, plays: int = 2000, listings: int = 20, collection: int = 1000,
+        latency: float = 0.0, jitter: float = 0.0, limited: float = 0.0,
+        flared: float = 0.0, throttled: float = 0.0, steps: int = 2, balance: float = 1e9,
+        batching: bool = True
+    ):
+        self.plays = plays
+        self.listings = listings
+        self.collection = collection
+        self.latency = latency
+        self.jitter = jitter
+        self.limited = limited
+        self.flared = flared
+        self.throttled = throttled
+        self.steps = steps
+        self.balance = balance
+        self.batching = batching
+        self.requests = 0
+        self.orders: Dict[str, dict] = {}
+        self.offers: Dict[str, dict] = {}
+        self.intents: Dict[str, str] = {}
+        self.operations = Registry()
+        self.operations.load_module(bot)
+        self.operations.load_directory(os.path.join(os.path.dirname(os.path.dirname(__file__)), 'endpoints'))
+        self.handlers = {
+            'SearchMomentListingsDefault': self.search_listings,
+            'GetUserMomentListingsDedicated': self.moment_listings,
+            'SearchMintedMoments': self.minted_moments,
+            'PurchaseP2PMomentMutation': self.purchase,
+            'GetUserP2PPurchaseOrder': self.purchase_order,
+            'GetPurchase': self.get_purchase,
+            'getBalance': lambda variables: self.balance,
+            'ConfirmPurchase': self.confirm_purchase,
+            'CreateMomentSaleMutation': self.sale,
+            'GetUserP2PListingOrder': self.listing_order,
+            'ConfirmInvocation': self.confirm_invocation,
+            'CreateMomentTransferRequest': lambda variables: {'ID': str(uuid.uuid4())},
+            'GetMomentTransferRequest': lambda variables: {'data': {
+                'id': variables['ID'], 'state': 'SUCCEEDED', 'invocationIntentID': str(uuid.uuid4())
+            }},
+            'GetProfile': lambda variables: {'publicInfo': {'dapperID': variables['id'], 'flowAddress': '0x0'}},
+            'DEFAULT_GetUserByUsername': lambda variables: {'publicInfo': {
+                'dapperID': str(uuid.uuid4()), 'username': variables['input']['username']
+            }},
+        }
+
+    @staticmethod
+    def price(play: int, rank: int) -> str:
+        return f'{5 + play % 97 + rank * 3}.00'
+
+    def search_listings(self, variables: dict) -> dict:
+        start = int(variables['cursor'] or 0)
+        end = min(self.plays, start + variables['limit'])
+        return {'data': {'searchSummary': {
+            'pagination': {'rightCursor': str(end)},
+            'data': {'size': end - start, 'data': [{
+                'set': {'id': 'set'},
+                'play': {'id': str(it)},
+                'priceRange': {'min': self.price(it, 0), 'max': self.price(it, self.listings - 1)}
+            } for it in range(start, end)]}
+        }}}
+
+    def moment_listings(self, variables: dict) -> dict:
+        play = int(variables['play_id'])
+        return {'data': {'momentListings': [{'moment': {
+            'id': f'{play}-{it}', 'price': self.price(play, it),
+            'flowId': str(play * self.listings + it), 'owner': {'dapperID': f'seller-{it}'}
+        }} for it in range(self.listings)]}}
+
+    def minted_moments(self, variables: dict) -> dict:
+        start = int(variables['cursor'] or 0)
+        end = min(self.collection, start + variables['limit'])
+        return {'data': {'searchSummary': {
+            'count': {'count': self.collection},
+            'pagination': {'rightCursor': str(end)},
+            'data': {'size': end - start, 'data': [{
+                'id': f'owned-{it}', 'price': '0.00', 'flowId': str(it),
+                'set': {'id': 'set'}, 'play': {'id': str(it % max(self.plays, 1))}
+            } for it in range(start, end)]}
+        }}}
+
+    def purchase(self, variables: dict) -> dict:
+        order_id = str(uuid.uuid4())
+        self.orders[order_id] = {'polls': 0, 'price': float(variables['price']), 'confirmed': None}
+        return {'orderID': order_id}
+
+    def purchase_order(self, variables: dict) -> dict:
+        order = self.orders[variables['order_id']]
+        order['polls'] += 1
+        intent = None
+        state = 'CREATED'
+        status = 'PENDING'
+        if order['polls'] > self.steps:
+            intent = f"intent-{variables['order_id']}"
+            self.intents[intent] = variables['order_id']
+            state = 'CREATE_INTENT_SUCCEEDED'
+        if order['confirmed'] is not None and order['polls'] - order['confirmed'] > self.steps:
+            state = 'PURCHASE_SUCCEEDED'
+            status = 'SUCCEEDED'
+        return {'data': {'state': state, 'status': status, 'purchaseIntentID': intent}}
+
+    def get_purchase(self, variables: dict) -> dict:
+        order = self.orders[self.intents[variables['intent_id']]]
+        return {'paymentOptions': [
+            {'id': 'card', 'amount': order['price'], 'paymentType': 'CREDIT_CARD'},
+            {'id': 'credits', 'amount': order['price'], 'paymentType': 'DAPPER_CREDITS'},
+        ]}
+
+    def confirm_purchase(self, variables: dict) -> dict:
+        order = self.orders[self.intents[variables['intent_id']]]
+        order['confirmed'] = order['polls']
+        self.balance -= order['price']
+        return {'status': 'INITIATED'}
+
+    def sale(self, variables: dict) -> dict:
+        offer_id = str(uuid.uuid4())
+        self.offers[offer_id] = {'polls': 0, 'confirmed': None}
+        return {'orderID': offer_id}
+
+    def listing_order(self, variables: dict) -> dict:
+        offer = self.offers[variables['offer_id']]
+        offer['polls'] += 1
+        state = 'CREATED'
+        if offer['polls'] > self.steps:
+            state = 'LISTING_INVOCATION_INTENT_CREATED'
+        if offer['confirmed'] is not None and offer['polls'] - offer['confirmed'] > self.steps:
+            state = 'LISTING_SUCCEEDED'
+        return {'data': {
+            'status': state, 'state': state,
+            'listingInvocationIntentID': f"listing-{variables['offer_id']}"
+        }}
+
+    def confirm_invocation(self, variables: dict) -> str:
+        intent = variables.get('intent_id') or variables['input']['id']
+        offer = self.offers.get(intent.replace('listing-', '', 1))
+        if offer is not None:
+            offer['confirmed'] = offer['polls']
+        return intent
+
+    async def handle(self, request: web.Request) -> web.Response:
+        self.requests += 1
+        body = await request.json()
+        if self.latency or self.jitter:
+            await asyncio.sleep(self.latency + random.uniform(0, self.jitter))
+        if random.random() < self.throttled:
+            return web.Response(status=429, headers={'Retry-After': '0'})
+        if random.random() < self.flared:
+            return web.Response(text='<html>Checking your browser</html>', content_type='text/html')
+        if isinstance(body, list):
+            if not self.batching:
+                return web.json_response({'errors': [{'message': 'Batching is not supported'}]}, status=400)
+            return web.json_response(list(map(self.respond, body)))
+        return web.json_response(self.respond(body))
+
+    def respond(self, body: dict) -> dict:
+        if random.random() < self.limited:
+            return {'errors': [{
+                'message': 'rate limited',
+                'extensions': {'status_code': 9, 'status_message': 'Please wait 0 minutes'}
+            }]}
+        name = body['operationName']
+        operation = self.operations.named(name)
+        return {'data': {operation.field: self.handlers[name](body.get('variables') or {})}}
+
+    async def start(self, host: str = '127.0.0.1', port: int = 0) -> str:
+        app = web.Application(client_max_size=16 * 1024 * 1024)
+        app.router.add_post('/graphql', self.handle)
+        self.runner = web.AppRunner(app)
+        await self.runner.setup()
+        site = web.TCPSite(self.runner, host, port)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        return f'http://{host}:{port}/graphql'
+
+    async def stop(self):
+        await self.runner.cleanup()
+
+
+if __name__ == '__main__':
+    async def serve():
+        standin = StandIn()
+        print(await standin.start(port=8080))
+        await asyncio.Event().wait()
+    asyncio.run(serve())
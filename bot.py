@@ -1,12 +1,27 @@
 import asyncio
-import json
+import heapq
 from typing import List
+from typing import Dict
+from typing import Tuple
 from typing import Callable
+from typing import Union
+from typing import Iterable
 from typing import Awaitable
+from typing import AsyncIterable
+from typing import AsyncIterator
+from typing import Set
+from sys import intern
 from time import time
 from enum import Enum
 
+from limiter import Backoff
+from limiter import TokenBucket
+from metrics import Metrics
+from metrics import logger
+from metrics import timed
 from session import ResponseException
+from session import RateLimitException
+from tracker import StatusTracker
 
 GET_MOMENTS = """
 query GetUserMomentListingsDedicated($set_id: ID!, $play_id: ID!) {
@@ -171,6 +186,9 @@ query GetPurchase($intent_id: ID!) {
     }
 }
 """
+GET_BALANCE = """
+query getBalance() { getBalance() }
+"""
 CREATE_PURCHASE = """
 mutation ConfirmPurchase($intent_id: ID!, $payment_id: ID!) {
     confirmPurchase(input: {
@@ -181,17 +199,30 @@ mutation ConfirmPurchase($intent_id: ID!, $payment_id: ID!) {
 """
 
 
+def parse_price(value) -> int:
+    if isinstance(value, str):
+        whole, _, _ = value.partition('.')
+        if whole.isdigit():
+            return int(whole)
+    return int(float(value))
+
+
 class Play:
-    def __init__(self, set_id: str, play_id: str, price: int = 0):
-        self.set_id = set_id
-        self.play_id = play_id
+    __slots__ = ('set_id', 'play_id', 'price', 'high')
+
+    def __init__(self, set_id: str, play_id: str, price: int = 0, high: int = 0):
+        self.set_id = intern(set_id)
+        self.play_id = intern(play_id)
         self.price = price
+        self.high = high
 
     def __str__(self):
         return f'${self.price} - {self.set_id} - {self.play_id}'
 
 
 class Moment:
+    __slots__ = ('play', 'moment_id', 'flow_id', 'owner_id', 'price')
+
     def __init__(self, play: Play, moment_id: str, flow_id: str, owner_id: str, price: int):
         self.play = play
         self.moment_id = moment_id
@@ -246,40 +277,88 @@ class Bot:
         self, period: int,
         solve_recaptcha: Callable[[str], Awaitable[str]],
         call_nba: Callable[[str, dict], Awaitable[dict]],
-        call_flow: Callable[[str, dict], Awaitable[dict]]
+        call_flow: Callable[[str, dict], Awaitable[dict]],
+        metrics: Metrics = None
     ):
         self.period = period
         self.solve_recaptcha = solve_recaptcha
         self.call_nba = call_nba
         self.call_flow = call_flow
-
-    async def get_plays(self, batch: int = 75, cap: int = 100000) -> List[Play]:
-        plays = []
-        cursor = ['']
+        self.metrics = metrics
+        self.catalog: Dict[Tuple[str, str], Play] = {}
+        self.backoff = Backoff()
+        self.tracker = StatusTracker(call_nba, slow=period)
+
+    def play(self, set_id: str, play_id: str) -> Play:
+        key = (set_id, play_id)
+        play = self.catalog.get(key)
+        if play is None:
+            play = self.catalog[key] = Play(set_id=set_id, play_id=play_id)
+        return play
+
+    @timed('page')
+    async def get_page(self, query: str, variables: dict) -> dict:
+        attempt = 0
         while True:
             try:
-                data = (await self.call_nba(GET_PLAYS, {
-                    'limit': batch,
-                    'cursor': cursor[0]
-                }))['data']['searchSummary']
-                size = data['data']['size']
-                for play in data['data']['data']:
-                    if len(plays) < cap:
-                        plays.append(Play(
-                            set_id=play['set']['id'],
-                            play_id=play['play']['id'],
-                            price=int(float(play['priceRange']['min']))
-                        ))
-                if size < batch or len(plays) >= cap:
-                    break
-                cursor[0] = data['pagination']['rightCursor']
+                return (await self.call_nba(query, variables))['data']['searchSummary']
             except Exception as e:
                 print('trying again')
                 print(e)
-                await asyncio.sleep(2)
-        plays.sort(key=lambda it: it.price)
-        return plays
-
+                await self.backoff.sleep(attempt)
+                attempt += 1
+
+    async def get_pages(self, query: str, variables: dict, batch: int) -> AsyncIterator[List[dict]]:
+        def fetch(cursor: str) -> asyncio.Task:
+            return asyncio.create_task(self.get_page(query, {
+                **variables, 'limit': batch, 'cursor': cursor
+            }))
+        pending = fetch('')
+        try:
+            while pending is not None:
+                data = await pending
+                pending = None
+                if data['data']['size'] >= batch:
+                    pending = fetch(data['pagination']['rightCursor'])
+                yield data['data']['data']
+        finally:
+            if pending is not None:
+                pending.cancel()
+
+    async def iter_plays(self, batch: int = 75, cap: int = 100000) -> AsyncIterator[Play]:
+        count = 0
+        pages = self.get_pages(GET_PLAYS, {}, batch)
+        try:
+            async for page in pages:
+                for play in page:
+                    if count >= cap:
+                        return
+                    count += 1
+                    yield Play(
+                        set_id=play['set']['id'],
+                        play_id=play['play']['id'],
+                        price=parse_price(play['priceRange']['min']),
+                        high=parse_price(play['priceRange']['max'])
+                    )
+        finally:
+            await pages.aclose()
+
+    async def get_plays(self, batch: int = 75, cap: int = 100000, top: int = None) -> List[Play]:
+        if top is None:
+            plays = [play async for play in self.iter_plays(batch, cap)]
+            plays.sort(key=lambda it: it.price)
+            return plays
+        heap = []
+        count = 0
+        async for play in self.iter_plays(batch, cap):
+            count += 1
+            if len(heap) < top:
+                heapq.heappush(heap, (-play.price, count, play))
+            elif play.price < -heap[0][0]:
+                heapq.heapreplace(heap, (-play.price, count, play))
+        return [play for _, _, play in sorted(heap, key=lambda it: (-it[0], it[1]))]
+
+    @timed('moments')
     async def get_moments(self, play: Play) -> List[Moment]:
         response = await self.call_nba(GET_MOMENTS, {
             'set_id': play.set_id, 'play_id': play.play_id
@@ -291,75 +370,134 @@ class Bot:
             play=play, moment_id=it['moment']['id'],
             flow_id=it['moment']['flowId'],
             owner_id=it['moment']['owner']['dapperID'],
-            price=int(float(it['moment']['price']))
+            price=parse_price(it['moment']['price'])
         ), moments))
 
-    async def get_collection(self, owner_id: str, batch: int, cap: int = 1000000) -> List[Moment]:
-        moments = []
-        cursor = ['']
-        while True:
+    async def scan(
+        self, plays: Union[Iterable[Play], AsyncIterable[Play]],
+        concurrency: int = 16, rate: float = None, failed: Set[Tuple[str, str]] = None
+    ) -> AsyncIterator[Tuple[Play, List[Moment]]]:
+        bucket = TokenBucket(rate) if rate else None
+        results = asyncio.Queue(maxsize=concurrency)
+        if hasattr(plays, '__aiter__'):
+            source = plays.__aiter__()
+            lock = asyncio.Lock()
+
+            async def take():
+                async with lock:
+                    try:
+                        return await source.__anext__()
+                    except StopAsyncIteration:
+                        return None
+        else:
+            source = iter(plays)
+
+            async def take():
+                return next(source, None)
+
+        async def worker():
+            while True:
+                play = await take()
+                if play is None:
+                    break
+                if bucket is not None:
+                    await bucket.acquire()
+                try:
+                    moments = await self.get_moments(play)
+                except Exception as reason:
+                    print(f'Reason: {reason}')
+                    if failed is not None:
+                        failed.add((play.set_id, play.play_id))
+                        continue
+                    moments = []
+                await results.put((play, moments))
+
+        async def drain():
             try:
-                data = (await self.call_nba(GET_COLLECTION, {
-                    'owner': owner_id, 'limit': batch, 'cursor': cursor[0]
-                }))['data']['searchSummary']
-                for moment in data['data']['data']:
-                    if len(moments) < cap:
-                        moments.append(Moment(
-                            play=Play(
-                                set_id=moment['set']['id'],
-                                play_id=moment['play']['id'],
-                            ),
-                            moment_id=moment['id'],
-                            flow_id=moment['flowId'],
-                            owner_id=owner_id,
-                            price=int(float(moment['price']))
-                        ))
-                size = data['data']['size']
-                if size < batch or len(moments) >= cap:
+                await asyncio.gather(*workers)
+            finally:
+                await results.put(None)
+
+        workers = [asyncio.create_task(worker()) for _ in range(concurrency)]
+        closer = asyncio.create_task(drain())
+        try:
+            while True:
+                result = await results.get()
+                if result is None:
+                    for task in workers:
+                        if task.done() and not task.cancelled() and task.exception() is not None:
+                            raise task.exception()
                     break
-                cursor[0] = data['pagination']['rightCursor']
-            except Exception as e:
-                print(e)
-                await asyncio.sleep(2)
-        return moments
+                yield result
+        finally:
+            for task in workers:
+                task.cancel()
+            closer.cancel()
+
+    async def iter_collection(self, owner_id: str, batch: int, cap: int = 1000000) -> AsyncIterator[Moment]:
+        count = 0
+        pages = self.get_pages(GET_COLLECTION, {'owner': owner_id}, batch)
+        try:
+            async for page in pages:
+                for moment in page:
+                    if count >= cap:
+                        return
+                    count += 1
+                    yield Moment(
+                        play=self.play(moment['set']['id'], moment['play']['id']),
+                        moment_id=moment['id'],
+                        flow_id=moment['flowId'],
+                        owner_id=owner_id,
+                        price=parse_price(moment['price'])
+                    )
+        finally:
+            await pages.aclose()
 
-    async def create_order(self, moment: Moment) -> Order:
+    async def get_collection(self, owner_id: str, batch: int, cap: int = 1000000) -> List[Moment]:
+        return [moment async for moment in self.iter_collection(owner_id, batch, cap)]
+
+    async def place_order(self, moment: Moment) -> str:
         url = 'https://www.nbatopshot.com/listings/p2p/{}+{}'
         token = await self.solve_recaptcha(
             url.format(moment.play.play_id, moment.play.play_id)
         )
-        order_id = (await self.call_nba(CREATE_ORDER, {
+        return (await self.call_nba(CREATE_ORDER, {
             'moment_id': moment.moment_id,
             'flow_id': moment.flow_id,
             'seller_id': moment.owner_id,
             'price': str(moment.price),
             'token': token,
         }))['orderID']
+
+    @timed('order')
+    async def create_order(self, moment: Moment) -> Order:
+        order_id = await self.place_order(moment)
         print(order_id)
         # order_id = 'f186faa7-5e73-407b-87ec-58533157d814'
-        while True:
-            try:
-                response = await self.call_nba(CHECK_ORDER, {'order_id': order_id})
-                state = response['data']['state']
-                print(json.dumps(response, indent=3))
-                if state == 'CREATE_INTENT_SUCCEEDED':
-                    return Order(order_id, response['data']['purchaseIntentID'])
-                elif state == 'PURCHASE_FAILED':
-                    raise Exception('Purchase failed!')
-                await asyncio.sleep(self.period)
-            except ResponseException:
-                pass
 
-    async def create_payment(self, order: Order) -> Payment:
+        def ready(response: dict) -> bool:
+            state = response['data']['state']
+            if state == 'PURCHASE_FAILED':
+                raise Exception('Purchase failed!')
+            return state == 'CREATE_INTENT_SUCCEEDED'
+        response = await self.tracker.wait(CHECK_ORDER, {'order_id': order_id}, ready)
+        logger.debug('order %s: %s', order_id, response)
+        return Order(order_id, response['data']['purchaseIntentID'])
+
+    async def get_payment_option(self, order: Order) -> dict:
         response = self.call_flow(CREATE_PAYMENT, {'intent_id': order.intent_id})
         payments = (await response)['paymentOptions']
-        payment = [it for it in payments if it['paymentType'] == 'DAPPER_CREDITS'][0]
-        balance = await self.call_flow('query getBalance() { getBalance() }', {})
+        return [it for it in payments if it['paymentType'] == 'DAPPER_CREDITS'][0]
+
+    @timed('payment')
+    async def create_payment(self, order: Order) -> Payment:
+        payment = await self.get_payment_option(order)
+        balance = await self.call_flow(GET_BALANCE, {})
         if payment['amount'] <= balance:
             return Payment(order, payment['id'])
         raise Exception('Out of Dapper credits!')
 
-    async def create_purchase(self, payment: Payment) -> Result:
+    async def confirm_purchase(self, payment: Payment, period: float = None):
         while True:
             try:
                 if not (await self.call_flow(CREATE_PURCHASE, {
@@ -370,49 +508,48 @@ class Bot:
                 break
             except ResponseException as reason:
                 print(reason)
-                await asyncio.sleep(self.period)
-        while True:
-            try:
-                data = await self.call_nba(CHECK_ORDER, {
-                    'order_id': payment.order.order_id
-                })
-                status = data['data']['status']
-                if status == 'FAILED':
-                    return Result.FAILED
-                elif status == 'SUCCEEDED':
-                    return Result.SUCCESSFUL
-            except Exception as e:
-                print(f'error: {e}')
-            await asyncio.sleep(self.period)
+                await asyncio.sleep(period or self.period)
+
+    async def wait_purchase(self, payment: Payment) -> Result:
+        data = await self.tracker.wait(
+            CHECK_ORDER, {'order_id': payment.order.order_id},
+            lambda it: it['data']['status'] in ('FAILED', 'SUCCEEDED')
+        )
+        if data['data']['status'] == 'SUCCEEDED':
+            return Result.SUCCESSFUL
+        return Result.FAILED
+
+    @timed('purchase')
+    async def create_purchase(self, payment: Payment) -> Result:
+        await self.confirm_purchase(payment)
+        return await self.wait_purchase(payment)
+
+    async def place_offer(self, moment: Moment, price: int) -> str:
+        return (await self.call_nba(CREATE_OFFER, {
+            'moment_id': moment.moment_id,
+            'flow_id': moment.flow_id,
+            'price': str(price)
+        }))['orderID']
+
+    async def wait_offer(self, offer_id: str) -> Offer:
+        response = await self.tracker.wait(
+            CHECK_OFFER, {'offer_id': offer_id},
+            lambda it: it['data']['state'] == 'LISTING_INVOCATION_INTENT_CREATED'
+        )
+        return Offer(offer_id, response['data']['listingInvocationIntentID'])
 
+    @timed('offer')
     async def create_offer(self, moment: Moment, price: int) -> Offer:
-        try:
-            offer_id = (await self.call_nba(CREATE_OFFER, {
-                'moment_id': moment.moment_id,
-                'flow_id': moment.flow_id,
-                'price': str(price)
-            }))['orderID']
-            while True:
-                try:
-                    response = await self.call_nba(CHECK_OFFER, {'offer_id': offer_id})
-                    if response['data']['state'] == 'LISTING_INVOCATION_INTENT_CREATED':
-                        return Offer(offer_id, response['data']['listingInvocationIntentID'])
-                except ResponseException:
-                    pass
-                await asyncio.sleep(self.period)
-        except ResponseException as reason:
-            data = json.loads(str(reason))
-            if not ('extensions' in data):
-                raise reason
-            error = data['extensions']
-            if error['status_code'] != 9:
-                raise reason
-            message = str(error['status_message'])
-            delay = message.split('wait ')[1].split(' minutes')[0]
-            print(f'Waiting: {delay}m')
-            await asyncio.sleep(int(delay) * 60)
-            return await self.create_offer(moment, price)
+        while True:
+            try:
+                offer_id = await self.place_offer(moment, price)
+                break
+            except RateLimitException as reason:
+                print(f'Waiting: {(reason.delay or 0) / 60:.0f}m')
+                await asyncio.sleep(reason.delay or 60.0)
+        return await self.wait_offer(offer_id)
 
+    @timed('listing')
     async def create_listing(self, offer: Offer):
         listing = await self.call_flow(CREATE_LISTING, {
             'intent_id': offer.intent_id,
@@ -420,15 +557,9 @@ class Bot:
         print(listing)
         if not listing == offer.intent_id:
             return Result.FAILED
-        while True:
-            try:
-                response = await self.call_nba(CHECK_OFFER, {'offer_id': offer.offer_id})
-                print(response['data']['state'])
-                if response['data']['state'] == 'LISTING_SUCCEEDED':
-                    return Result.SUCCESSFUL
-            except ResponseException as e:
-                print('error')
-                print(e)
-                pass
-            await asyncio.sleep(self.period)
+        await self.tracker.wait(
+            CHECK_OFFER, {'offer_id': offer.offer_id},
+            lambda it: it['data']['state'] == 'LISTING_SUCCEEDED'
+        )
+        return Result.SUCCESSFUL
 
@@ -0,0 +1,108 @@
+import asyncio
+import json
+import time
+from collections import OrderedDict
+from typing import Awaitable, Callable, Dict, List, Set, Tuple
+
+from operations import Registry
+
+TTLS = {
+    'GetUserMomentListingsDedicated': 2.0,
+    'SearchMintedMoments': 30.0,
+    'getBalance': 10.0,
+    'GetProfile': 300.0,
+    'DEFAULT_GetUserByUsername': 300.0,
+}
+INVALIDATES = {
+    'PurchaseP2PMomentMutation': ['getBalance', 'GetUserMomentListingsDedicated'],
+    'ConfirmPurchase': ['getBalance', 'SearchMintedMoments', 'GetUserMomentListingsDedicated'],
+    'CreateMomentSaleMutation': ['SearchMintedMoments', 'GetUserMomentListingsDedicated'],
+    'ConfirmInvocation': ['SearchMintedMoments', 'GetUserMomentListingsDedicated'],
+    'CreateMomentTransferRequest': ['SearchMintedMoments'],
+}
+
+Key = Tuple[str, str, str]
+
+
+class ResponseCache:
+    def __init__(
+        self, operations: Registry, ttls: Dict[str, float] = None,
+        invalidates: Dict[str, List[str]] = None, capacity: int = 32 * 1024 * 1024
+    ):
+        self.operations = operations
+        self.ttls = TTLS if ttls is None else ttls
+        self.invalidates = INVALIDATES if invalidates is None else invalidates
+        self.capacity = capacity
+        self.size = 0
+        self.entries: 'OrderedDict[Key, Tuple[float, int, dict]]' = OrderedDict()
+        self.names: Dict[str, Set[Key]] = {}
+        self.pending: Dict[Key, asyncio.Future] = {}
+        self.generations: Dict[str, int] = {}
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: Key):
+        entry = self.entries.get(key)
+        if entry is None:
+            return None
+        if entry[0] <= time.monotonic():
+            self.discard(key)
+            return None
+        self.entries.move_to_end(key)
+        return entry[2]
+
+    def put(self, key: Key, value: dict, ttl: float):
+        self.discard(key)
+        size = len(json.dumps(value))
+        if size > self.capacity:
+            return
+        self.entries[key] = (time.monotonic() + ttl, size, value)
+        self.names.setdefault(key[1], set()).add(key)
+        self.size += size
+        while self.size > self.capacity:
+            self.discard(next(iter(self.entries)))
+
+    def discard(self, key: Key):
+        entry = self.entries.pop(key, None)
+        if entry is not None:
+            self.size -= entry[1]
+            self.names[key[1]].discard(key)
+
+    def invalidate(self, name: str):
+        for target in self.invalidates.get(name, ()):
+            self.generations[target] = self.generations.get(target, 0) + 1
+            for key in list(self.names.get(target, ())):
+                self.discard(key)
+
+    def wrap(self, call: Callable[[str, dict], Awaitable[dict]], tag: str) -> Callable[[str, dict], Awaitable[dict]]:
+        async def cached(query: str, variables: dict) -> dict:
+            operation = self.operations.get(query)
+            if operation.mutation:
+                try:
+                    return await call(query, variables)
+                finally:
+                    self.invalidate(operation.name)
+            ttl = self.ttls.get(operation.name)
+            if not ttl:
+                return await call(query, variables)
+            key = (tag, operation.name, json.dumps(variables, sort_keys=True))
+            value = self.get(key)
+            if value is not None:
+                self.hits += 1
+                return value
+            pending = self.pending.get(key)
+            if pending is not None:
+                self.hits += 1
+                return await asyncio.shield(pending)
+            self.misses += 1
+            generation = self.generations.get(operation.name, 0)
+            pending = self.pending[key] = asyncio.ensure_future(call(query, variables))
+            try:
+                value = await asyncio.shield(pending)
+            finally:
+                if self.pending.get(key) is pending:
+                    del self.pending[key]
+            if generation == self.generations.get(operation.name, 0):
+                self.put(key, value, ttl)
+            return value
+        return cached
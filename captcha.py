@@ -0,0 +1,112 @@
+import asyncio
+import time
+from collections import deque
+from typing import Deque, List, Optional, Tuple
+
+from aiohttp import ClientSession
+
+
+class TwoCaptcha:
+    def __init__(self, http: ClientSession, key_api: str, key_site: str, period: float = 15.0):
+        self.http = http
+        self.key_api = key_api
+        self.key_site = key_site
+        self.period = period
+
+    async def solve(self, url: str) -> Optional[str]:
+        params = {
+            'key': self.key_api,
+            'method': 'userrecaptcha',
+            'action': 'verify',
+            'version': 'v3',
+            'googlekey': self.key_site,
+            'pageurl': url,
+            'json': '1'
+        }
+        try:
+            async with self.http.get('http://CAPTCHA SOLVER.com/in.php', params=params) as response:
+                token = (await response.json())['request']
+                while True:
+                    data = {'key': self.key_api, 'action': 'get', 'json': '1', 'id': token}
+                    async with self.http.get('http://2captcha.com/res.php', params=data) as check:
+                        data = await check.json()
+                        if data['status'] == 1:
+                            return data['request']
+                    await asyncio.sleep(self.period)
+        except Exception as reason:
+            print(f'Reason: {reason}')
+
+
+class FakeSolver:
+    def __init__(self, delay: float = 0.0, token: str = 'fake-token'):
+        self.delay = delay
+        self.token = token
+        self.solved = 0
+
+    async def solve(self, url: str) -> Optional[str]:
+        await asyncio.sleep(self.delay)
+        self.solved += 1
+        return f'{self.token}-{self.solved}'
+
+
+class TokenPool:
+    def __init__(self, solver, url: str, size: int = 3, ttl: float = 110.0, lead: float = 30.0):
+        self.solver = solver
+        self.url = url
+        self.size = size
+        self.ttl = ttl
+        self.lead = lead
+        self.tokens: Deque[Tuple[str, float]] = deque()
+        self.solving = 0
+        self.demand: Optional[asyncio.Event] = None
+        self.workers: List[asyncio.Task] = []
+
+    def prune(self):
+        now = time.monotonic()
+        while self.tokens and self.tokens[0][1] <= now:
+            self.tokens.popleft()
+
+    def fresh(self) -> List[float]:
+        cutoff = time.monotonic() + min(self.lead, self.ttl / 2)
+        return [expiry - cutoff for _, expiry in self.tokens if expiry > cutoff]
+
+    def start(self):
+        self.demand = asyncio.Event()
+        self.workers = [asyncio.create_task(self.fill()) for _ in range(self.size)]
+
+    async def stop(self):
+        for worker in self.workers:
+            worker.cancel()
+        self.workers = []
+
+    async def fill(self):
+        while True:
+            self.prune()
+            fresh = self.fresh()
+            if len(fresh) + self.solving >= self.size:
+                self.demand.clear()
+                wait = fresh[0] if fresh else None
+                try:
+                    await asyncio.wait_for(self.demand.wait(), wait)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            self.solving += 1
+            started = time.monotonic()
+            try:
+                token = await self.solver.solve(self.url)
+            finally:
+                self.solving -= 1
+            self.lead = max(self.lead * 0.8, time.monotonic() - started)
+            if token:
+                self.tokens.append((token, time.monotonic() + self.ttl))
+            else:
+                await asyncio.sleep(1)
+
+    async def take(self, url: str = None) -> Optional[str]:
+        self.prune()
+        if self.demand is not None:
+            self.demand.set()
+        if self.tokens:
+            return self.tokens.popleft()[0]
+        return await self.solver.solve(url or self.url)
@@ -0,0 +1,120 @@
+import asyncio
+import bisect
+import hashlib
+from contextlib import AsyncExitStack
+from typing import AsyncIterator, Awaitable, Callable, Dict, List, Set, Tuple, Union
+
+from account import Account
+from bot import Bot, Moment, Play, Result
+from credentials import CredentialCache, cache_key
+from engine import TradeEngine
+from session import Session
+
+
+def position(key: str) -> int:
+    return int.from_bytes(hashlib.sha1(key.encode()).digest()[:8], 'big')
+
+
+class HashRing:
+    def __init__(self, nodes: List[str], replicas: int = 64):
+        self.points: List[int] = []
+        self.nodes: Dict[int, str] = {}
+        for node in nodes:
+            for replica in range(replicas):
+                point = position(f'{node}#{replica}')
+                self.nodes[point] = node
+                bisect.insort(self.points, point)
+
+    def node(self, key: str) -> str:
+        index = bisect.bisect(self.points, position(key)) % len(self.points)
+        return self.nodes[self.points[index]]
+
+
+class Worker:
+    def __init__(self, name: str, session: Session, bot: Bot):
+        self.name = name
+        self.session = session
+        self.bot = bot
+        self.engine = TradeEngine(bot)
+
+    @staticmethod
+    async def open(
+        stack: AsyncExitStack, name: str, proxy: Union[str, List[str]], call_nba: str, call_flow: str,
+        solve: Callable[[Session], Awaitable[Callable[[str], Awaitable[str]]]],
+        username: str = None, password: str = None, period: int = 5
+    ) -> 'Worker':
+        session = await stack.enter_async_context(Session(proxy))
+
+        async def no_token() -> str:
+            return ''
+        refresh_nba = refresh_flow = no_token
+        if username is not None:
+            cache = CredentialCache(f'credentials-{name}.bin', cache_key(password))
+            account = await stack.enter_async_context(Account(username, password, profile=f'profile-{name}', cache=cache))
+            refresh_nba = account.nba_token
+            refresh_flow = account.flow_token
+        bot = Bot(
+            period=period,
+            solve_recaptcha=await solve(session),
+            call_nba=await session.create_caller(call_nba, 'x-id-token', refresh_nba),
+            call_flow=await session.create_caller(call_flow, 'Authorization', refresh_flow),
+            metrics=session.metrics
+        )
+        return Worker(name, session, bot)
+
+
+class Coordinator:
+    def __init__(self, workers: List[Worker]):
+        self.workers = {worker.name: worker for worker in workers}
+        self.ring = HashRing(list(self.workers))
+        self.claimed: Set[str] = set()
+
+    def owner(self, play: Play) -> Worker:
+        return self.workers[self.ring.node(f'{play.set_id}/{play.play_id}')]
+
+    def claim(self, moment: Moment) -> bool:
+        if moment.moment_id in self.claimed:
+            return False
+        self.claimed.add(moment.moment_id)
+        return True
+
+    async def sweep(self, concurrency: int = 16) -> AsyncIterator[Tuple[Worker, Play, List[Moment]]]:
+        shards: Dict[str, List[Play]] = {name: [] for name in self.workers}
+        lister = next(iter(self.workers.values()))
+        async for play in lister.bot.iter_plays():
+            shards[self.owner(play).name].append(play)
+        results = asyncio.Queue()
+
+        async def scan(worker: Worker):
+            async for play, moments in worker.bot.scan(shards[worker.name], concurrency):
+                await results.put((worker, play, moments))
+
+        async def drain():
+            await asyncio.gather(*map(scan, self.workers.values()))
+            await results.put(None)
+        closer = asyncio.create_task(drain())
+        try:
+            while True:
+                result = await results.get()
+                if result is None:
+                    break
+                yield result
+        finally:
+            closer.cancel()
+
+    async def buy(self, moment: Moment, markup: int) -> Result:
+        if not self.claim(moment):
+            return Result.FAILED
+        workers = sorted(self.workers.values(), key=lambda it: it.engine.budget.available, reverse=True)
+        for worker in workers:
+            if await worker.engine.budget.reserve(moment.price):
+                try:
+                    result = await worker.engine.trade(moment, markup, reserved=True)
+                except Exception as reason:
+                    print(f'{worker.name} failed {moment}: {reason}')
+                    result = Result.FAILED
+                if not result:
+                    self.claimed.discard(moment.moment_id)
+                return result
+        self.claimed.discard(moment.moment_id)
+        return Result.FAILED
@@ -0,0 +1,44 @@
+import base64
+import hashlib
+import json
+import os
+import time
+from typing import Optional
+
+
+def cache_key(password: str) -> str:
+    return os.environ.get('TOPSHOT_CACHE_KEY', password)
+
+
+class CredentialCache:
+    def __init__(self, path: str, secret: str, salt: bytes = b'topshot-credentials'):
+        self.path = path
+        key = hashlib.pbkdf2_hmac('sha256', secret.encode(), salt, 200000)
+        self.key = base64.urlsafe_b64encode(key)
+
+    def cipher(self):
+        from cryptography.fernet import Fernet
+        return Fernet(self.key)
+
+    def load(self) -> Optional[dict]:
+        if not os.path.exists(self.path):
+            return None
+        try:
+            with open(self.path, 'rb') as file:
+                return json.loads(self.cipher().decrypt(file.read()))
+        except Exception as reason:
+            print(f'Ignoring credential cache: {reason}')
+            return None
+
+    def save(self, data: dict):
+        data = {**data, 'saved': time.time()}
+        encrypted = self.cipher().encrypt(json.dumps(data).encode())
+        temporary = self.path + '.tmp'
+        with open(temporary, 'wb') as file:
+            file.write(encrypted)
+        os.chmod(temporary, 0o600)
+        os.replace(temporary, self.path)
+
+    def clear(self):
+        if os.path.exists(self.path):
+            os.remove(self.path)
@@ -0,0 +1,167 @@
+import json
+from typing import Any, Dict, List, Optional, TypedDict, Union
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import msgspec
+except ImportError:
+    msgspec = None
+
+Price = Union[str, float]
+
+
+class Identified(TypedDict):
+    id: str
+
+
+class Owner(TypedDict):
+    dapperID: str
+
+
+class ListedMoment(TypedDict):
+    id: str
+    price: Price
+    flowId: str
+    owner: Owner
+
+
+class MomentListing(TypedDict):
+    moment: ListedMoment
+
+
+class MomentListings(TypedDict):
+    momentListings: List[MomentListing]
+
+
+class GetUserMomentListings(TypedDict):
+    data: MomentListings
+
+
+class PriceRange(TypedDict):
+    min: Price
+    max: Price
+
+
+class PlayListing(TypedDict):
+    set: Identified
+    play: Identified
+    priceRange: PriceRange
+
+
+class MintedMoment(TypedDict):
+    id: str
+    price: Price
+    flowId: str
+    set: Identified
+    play: Identified
+
+
+class Pagination(TypedDict):
+    rightCursor: str
+
+
+class PlayPage(TypedDict):
+    size: int
+    data: List[PlayListing]
+
+
+class MintedPage(TypedDict):
+    size: int
+    data: List[MintedMoment]
+
+
+class PlaySummary(TypedDict):
+    pagination: Pagination
+    data: PlayPage
+
+
+class MintedSummary(TypedDict):
+    pagination: Pagination
+    data: MintedPage
+
+
+class PlaySearch(TypedDict):
+    searchSummary: PlaySummary
+
+
+class MintedSearch(TypedDict):
+    searchSummary: MintedSummary
+
+
+class SearchMomentListings(TypedDict):
+    data: PlaySearch
+
+
+class SearchMintedMoments(TypedDict):
+    data: MintedSearch
+
+
+class OrderState(TypedDict, total=False):
+    state: str
+    status: str
+    purchaseIntentID: Optional[str]
+    listingInvocationIntentID: Optional[str]
+
+
+class OrderStatus(TypedDict):
+    data: OrderState
+
+
+SHAPES = {
+    'GetUserMomentListingsDedicated': ('getUserMomentListings', Optional[GetUserMomentListings]),
+    'SearchMomentListingsDefault': ('searchMomentListings', Optional[SearchMomentListings]),
+    'SearchMintedMoments': ('searchMintedMoments', Optional[SearchMintedMoments]),
+    'GetUserP2PPurchaseOrder': ('getUserP2PPurchaseOrder', Optional[OrderStatus]),
+    'GetUserP2PListingOrder': ('getUserP2PListingOrder', Optional[OrderStatus]),
+}
+
+
+def envelope(field: str, shape) -> type:
+    data = TypedDict(f'{field}Data', {field: shape}, total=False)
+    return TypedDict(f'{field}Response', {
+        'data': Optional[data], 'errors': List[Dict[str, Any]], 'error': Any
+    }, total=False)
+
+
+class Decoder:
+    def __init__(self, backend: str = None, typed: bool = True):
+        if backend is None:
+            backend = 'msgspec' if msgspec is not None else 'orjson' if orjson is not None else 'json'
+        self.backend = backend
+        self.typed: Dict[str, Any] = {}
+        self.plain = None
+        self.parts = None
+        if backend == 'msgspec':
+            self.plain = msgspec.json.Decoder()
+            self.parts = msgspec.json.Decoder(List[msgspec.Raw])
+            if typed:
+                for name, (field, shape) in SHAPES.items():
+                    self.typed[name] = msgspec.json.Decoder(envelope(field, shape))
+
+    def decode(self, raw: bytes, name: str = None) -> dict:
+        if self.backend == 'msgspec':
+            typed = self.typed.get(name)
+            if typed is not None:
+                try:
+                    return typed.decode(raw)
+                except msgspec.ValidationError:
+                    pass
+            return self.plain.decode(raw)
+        if self.backend == 'orjson':
+            return orjson.loads(raw)
+        return json.loads(raw)
+
+    def decode_many(self, raw: bytes, names: List[str]) -> Union[dict, List[dict]]:
+        if self.parts is None:
+            return self.decode(raw)
+        try:
+            parts = self.parts.decode(raw)
+        except msgspec.ValidationError:
+            return self.plain.decode(raw)
+        if len(parts) != len(names):
+            return [self.plain.decode(part) for part in parts]
+        return [self.decode(part, name) for part, name in zip(parts, names)]
@@ -0,0 +1,117 @@
+import asyncio
+import time
+from typing import Awaitable, Callable, Dict, Iterable, List, TypeVar
+
+from bot import Bot, Moment, Result, GET_BALANCE
+
+T = TypeVar('T')
+
+STAGES = ('order', 'payment', 'purchase', 'offer', 'listing')
+
+
+class CreditBudget:
+    def __init__(self, fetch: Callable[[], Awaitable[float]], ttl: float = 30.0):
+        self.fetch = fetch
+        self.ttl = ttl
+        self.balance = 0.0
+        self.reserved = 0.0
+        self.updated = 0.0
+        self.lock = asyncio.Lock()
+
+    @property
+    def available(self) -> float:
+        return self.balance - self.reserved
+
+    async def refresh(self):
+        self.balance = float(await self.fetch())
+        self.updated = time.monotonic()
+
+    async def reserve(self, amount: float) -> bool:
+        async with self.lock:
+            if time.monotonic() - self.updated > self.ttl:
+                await self.refresh()
+            if amount > self.available:
+                return False
+            self.reserved += amount
+            return True
+
+    def release(self, amount: float):
+        self.reserved = max(0.0, self.reserved - amount)
+
+    def spend(self, amount: float):
+        self.release(amount)
+        self.balance -= amount
+
+
+class StageStats:
+    def __init__(self):
+        self.successes = 0
+        self.failures = 0
+        self.latencies: List[float] = []
+
+    def record(self, latency: float, success: bool):
+        self.latencies.append(latency)
+        if success:
+            self.successes += 1
+        else:
+            self.failures += 1
+
+    def __str__(self):
+        if not self.latencies:
+            return 'idle'
+        ordered = sorted(self.latencies)
+        median = ordered[len(ordered) // 2]
+        return f'{self.successes} ok, {self.failures} failed, median {median:.2f}s, max {ordered[-1]:.2f}s'
+
+
+class TradeEngine:
+    def __init__(self, bot: Bot, budget: CreditBudget = None, limits: Dict[str, int] = None):
+        self.bot = bot
+        self.budget = budget or CreditBudget(lambda: bot.call_flow(GET_BALANCE, {}))
+        limits = {'order': 4, 'payment': 4, 'purchase': 4, 'offer': 2, 'listing': 2, **(limits or {})}
+        self.gates = {name: asyncio.Semaphore(limits[name]) for name in STAGES}
+        self.stats = {name: StageStats() for name in STAGES}
+        self.rejected = 0
+
+    async def stage(self, name: str, action: Callable[[], Awaitable[T]]) -> T:
+        async with self.gates[name]:
+            started = time.monotonic()
+            try:
+                result = await action()
+            except Exception:
+                self.stats[name].record(time.monotonic() - started, False)
+                raise
+            self.stats[name].record(time.monotonic() - started, result is not Result.FAILED)
+            return result
+
+    async def trade(self, moment: Moment, markup: int, reserved: bool = False) -> Result:
+        if not reserved and not await self.budget.reserve(moment.price):
+            self.rejected += 1
+            return Result.FAILED
+        try:
+            order = await self.stage('order', lambda: self.bot.create_order(moment))
+            payment = await self.stage('payment', lambda: self.bot.create_payment(order))
+            purchase = await self.stage('purchase', lambda: self.bot.create_purchase(payment))
+        except Exception:
+            self.budget.release(moment.price)
+            raise
+        if not purchase:
+            self.budget.release(moment.price)
+            return purchase
+        self.budget.spend(moment.price)
+        offer = await self.stage('offer', lambda: self.bot.create_offer(moment, moment.price + markup))
+        return await self.stage('listing', lambda: self.bot.create_listing(offer))
+
+    async def run(self, moments: Iterable[Moment], markup: int) -> List[Result]:
+        async def attempt(moment: Moment) -> Result:
+            try:
+                return await self.trade(moment, markup)
+            except Exception as reason:
+                print(f'Failed {moment}: {reason}')
+                return Result.FAILED
+        return list(await asyncio.gather(*map(attempt, moments)))
+
+    def report(self) -> str:
+        lines = [f'{name}: {self.stats[name]}' for name in STAGES]
+        lines.append(f'budget: {self.budget.available:.2f} available, {self.rejected} rejected')
+        return '\n'.join(lines)
@@ -0,0 +1,120 @@
+import sqlite3
+import time
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from bot import Moment, Play
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS snapshots (
+    set_id TEXT NOT NULL,
+    play_id TEXT NOT NULL,
+    ts REAL NOT NULL,
+    price INTEGER NOT NULL,
+    high INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS snapshots_play ON snapshots (set_id, play_id, ts);
+CREATE TABLE IF NOT EXISTS listings (
+    set_id TEXT NOT NULL,
+    play_id TEXT NOT NULL,
+    ts REAL NOT NULL,
+    moment_id TEXT NOT NULL,
+    price INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS listings_play ON listings (set_id, play_id, ts);
+"""
+
+
+class History:
+    def __init__(self, path: str = 'history.db'):
+        self.db = sqlite3.connect(path)
+        self.db.execute('PRAGMA journal_mode=WAL')
+        self.db.execute('PRAGMA synchronous=NORMAL')
+        self.db.executescript(SCHEMA)
+        self.floors: Dict[Tuple[str, str], Tuple[float, int]] = {}
+        self.books: Dict[Tuple[str, str], Tuple[float, List[int]]] = {}
+
+    def record_plays(self, plays: Iterable[Play], ts: float = None):
+        ts = ts or time.time()
+        rows = [(play.set_id, play.play_id, ts, play.price, play.high) for play in plays]
+        with self.db:
+            self.db.executemany('INSERT INTO snapshots VALUES (?, ?, ?, ?, ?)', rows)
+        for set_id, play_id, _, price, _ in rows:
+            self.floors[(set_id, play_id)] = (ts, price)
+
+    def record_moments(self, play: Play, moments: Iterable[Moment], ts: float = None):
+        ts = ts or time.time()
+        rows = [(play.set_id, play.play_id, ts, moment.moment_id, moment.price) for moment in moments]
+        with self.db:
+            self.db.executemany('INSERT INTO listings VALUES (?, ?, ?, ?, ?)', rows)
+        self.books[(play.set_id, play.play_id)] = (ts, sorted(row[4] for row in rows))
+
+    def floor(self, play: Play) -> Optional[int]:
+        cached = self.floors.get((play.set_id, play.play_id))
+        if cached is not None:
+            return cached[1]
+        row = self.db.execute(
+            'SELECT ts, price FROM snapshots WHERE set_id = ? AND play_id = ? ORDER BY ts DESC LIMIT 1',
+            (play.set_id, play.play_id)
+        ).fetchone()
+        if row is None:
+            return None
+        self.floors[(play.set_id, play.play_id)] = row
+        return row[1]
+
+    def floor_history(self, play: Play, since: float = 0.0) -> List[Tuple[float, int]]:
+        return self.db.execute(
+            'SELECT ts, price FROM snapshots WHERE set_id = ? AND play_id = ? AND ts >= ? ORDER BY ts',
+            (play.set_id, play.play_id, since)
+        ).fetchall()
+
+    def rolling_floor(self, play: Play, window: float) -> Optional[float]:
+        return self.db.execute(
+            'SELECT AVG(price) FROM snapshots WHERE set_id = ? AND play_id = ? AND ts >= ?',
+            (play.set_id, play.play_id, time.time() - window)
+        ).fetchone()[0]
+
+    def rolling_floors(self, window: float) -> Dict[Tuple[str, str], float]:
+        return {(set_id, play_id): price for set_id, play_id, price in self.db.execute(
+            'SELECT set_id, play_id, AVG(price) FROM snapshots WHERE ts >= ? GROUP BY set_id, play_id',
+            (time.time() - window,)
+        )}
+
+    def book(self, play: Play) -> List[int]:
+        cached = self.books.get((play.set_id, play.play_id))
+        if cached is not None:
+            return cached[1]
+        latest = self.db.execute(
+            'SELECT MAX(ts) FROM listings WHERE set_id = ? AND play_id = ?',
+            (play.set_id, play.play_id)
+        ).fetchone()[0]
+        if latest is None:
+            return []
+        prices = [row[0] for row in self.db.execute(
+            'SELECT price FROM listings WHERE set_id = ? AND play_id = ? AND ts = ? ORDER BY price',
+            (play.set_id, play.play_id, latest)
+        )]
+        self.books[(play.set_id, play.play_id)] = (latest, prices)
+        return prices
+
+    def valuation(self, play: Play, count: int = 10) -> Optional[float]:
+        prices = self.book(play)[:count]
+        if not prices:
+            return None
+        return sum(prices) / len(prices)
+
+    def compact(self, age: float, bucket: float = 3600.0):
+        cutoff = time.time() - age
+        with self.db:
+            self.db.execute('DELETE FROM listings WHERE ts < ?', (cutoff,))
+            self.db.execute(
+                'CREATE TEMP TABLE rollup AS '
+                'SELECT set_id, play_id, CAST(ts / ? AS INTEGER) * ? AS ts, MIN(price) AS price, MAX(high) AS high '
+                'FROM snapshots WHERE ts < ? GROUP BY set_id, play_id, CAST(ts / ? AS INTEGER)',
+                (bucket, bucket, cutoff, bucket)
+            )
+            self.db.execute('DELETE FROM snapshots WHERE ts < ?', (cutoff,))
+            self.db.execute('INSERT INTO snapshots SELECT * FROM rollup')
+            self.db.execute('DROP TABLE rollup')
+
+    def close(self):
+        self.db.close()
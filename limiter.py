@@ -0,0 +1,140 @@
+import asyncio
+import random
+import time
+from typing import Dict, Optional
+
+
+class TokenBucket:
+    def __init__(
+        self, rate: float, capacity: float = None,
+        floor: float = None, ceiling: float = None
+    ):
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(rate, 1.0)
+        self.floor = floor if floor is not None else rate
+        self.ceiling = ceiling if ceiling is not None else rate
+        self.tokens = self.capacity
+        self.stamp = time.monotonic()
+        self.paused = 0.0
+        self.restore: Optional[float] = None
+        self.latency = None
+        self.lock = asyncio.Lock()
+
+    def refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.stamp) * self.rate)
+        self.stamp = now
+
+    async def acquire(self, amount: float = 1.0, reserve: float = 0.0):
+        async with self.lock:
+            await self.take(amount, reserve)
+
+    async def take(self, amount: float = 1.0, reserve: float = 0.0):
+        while True:
+            wait = self.paused - time.monotonic()
+            if wait > 0:
+                await asyncio.sleep(wait)
+                continue
+            if self.restore is not None:
+                self.rate = max(self.rate, self.restore)
+                self.restore = None
+            self.refill()
+            if self.tokens - reserve >= amount:
+                self.tokens -= amount
+                return
+            await asyncio.sleep((amount + reserve - self.tokens) / self.rate)
+
+    def pause(self, delay: float, restore: bool = False):
+        if restore:
+            self.restore = max(self.restore or 0.0, self.rate)
+        self.paused = max(self.paused, time.monotonic() + delay)
+        self.tokens = 0.0
+
+    def increase(self, step: float):
+        self.rate = min(self.ceiling, self.rate + step * max(1.0, self.rate))
+
+    def decrease(self, factor: float):
+        self.rate = max(self.floor, self.rate * factor)
+
+    def observe(self, latency: float, slow: float = 3.0, weight: float = 0.1):
+        if self.latency is None:
+            self.latency = latency
+            return
+        if latency > slow * self.latency:
+            self.decrease(0.9)
+        self.latency += weight * (latency - self.latency)
+
+
+class Backoff:
+    def __init__(self, base: float = 0.5, cap: float = 30.0):
+        self.base = base
+        self.cap = cap
+
+    def delay(self, attempt: int) -> float:
+        return random.uniform(0, min(self.cap, self.base * 2 ** min(attempt, 32)))
+
+    async def sleep(self, attempt: int):
+        await asyncio.sleep(self.delay(attempt))
+
+
+class RateLimiter:
+    def __init__(
+        self, endpoint_rate: float = 20.0, endpoint_ceiling: float = 50.0,
+        operation_rate: float = 10.0, operation_ceiling: float = 25.0,
+        floor: float = 0.2, step: float = 0.05, backoff: Backoff = None,
+        reserve: float = 2.0
+    ):
+        self.endpoint_rate = endpoint_rate
+        self.endpoint_ceiling = endpoint_ceiling
+        self.operation_rate = operation_rate
+        self.operation_ceiling = operation_ceiling
+        self.floor = floor
+        self.step = step
+        self.backoff = backoff or Backoff()
+        self.reserve = reserve
+        self.endpoints: Dict[str, TokenBucket] = {}
+        self.operations: Dict[str, TokenBucket] = {}
+
+    def endpoint(self, url: str) -> TokenBucket:
+        bucket = self.endpoints.get(url)
+        if bucket is None:
+            bucket = self.endpoints[url] = TokenBucket(
+                self.endpoint_rate, floor=self.floor, ceiling=self.endpoint_ceiling
+            )
+        return bucket
+
+    def operation(self, name: str) -> TokenBucket:
+        bucket = self.operations.get(name)
+        if bucket is None:
+            bucket = self.operations[name] = TokenBucket(
+                self.operation_rate, floor=self.floor, ceiling=self.operation_ceiling
+            )
+        return bucket
+
+    async def acquire(self, url: str, name: str = None, critical: bool = False, amount: float = 1.0):
+        bucket = self.endpoint(url)
+        if critical:
+            await bucket.take()
+        else:
+            await bucket.acquire(reserve=min(self.reserve, bucket.capacity - 1.0))
+        if name is not None:
+            await self.operation(name).acquire(amount)
+
+    def succeeded(self, url: str, name: str, latency: Optional[float]):
+        for bucket in (self.endpoint(url), self.operation(name)):
+            if latency is not None:
+                bucket.observe(latency)
+            bucket.increase(self.step)
+
+    def throttled(self, url: str, delay: float = None, attempt: int = 0):
+        bucket = self.endpoint(url)
+        if delay is not None:
+            bucket.pause(delay, restore=True)
+        else:
+            bucket.pause(self.backoff.delay(attempt))
+        bucket.decrease(0.5)
+
+    def cooldown(self, name: str, delay: float):
+        bucket = self.operation(name)
+        bucket.pause(delay, restore=True)
+        bucket.decrease(0.5)
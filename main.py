@@ -1,16 +1,30 @@
 import asyncio
 import json
+import os
 import time
-from typing import Optional
+from contextlib import AsyncExitStack
+from typing import List, Optional
 
+import bot as queries
 from account import Account
 from session import Session, ResponseException
 from bot import Bot, Result, Play, Moment
+from coordinator import Coordinator, Worker
+from credentials import CredentialCache, cache_key
+from engine import TradeEngine
+from history import History
+from processes import ScanPool, decode
+from relist import Relister, undercut_floor
+from scanner import MarketScanner
+from scoring import score
+from sniper import Sniper
+from table import MomentTable
 from asyncio import WindowsSelectorEventLoopPolicy
 
 # lots of censored info
 
 PROXY = 'censored'
+PROXIES = [PROXY]
 REFRESH_NBA = 'censored'
 REFRESH_DAPPER = 'censored'
 CALL_NBA = 'censored'
@@ -23,12 +37,26 @@ USERNAME = 'user'
 PASSWORD = 'pass'
 
 AUTHENTICATE = True
+PROFILE = 'profile'
+CREDENTIALS = 'credentials.bin'
+# candidates older than this (seconds) are likely gone already
+STALE = 2.0
+
+# (username, password, proxy) per sharded worker
+ACCOUNTS = [
+    (USERNAME, PASSWORD, PROXY),
+]
 
 SET = ''
 PLAYS = [
 ]
 
 
+def account() -> Account:
+    cache = CredentialCache(CREDENTIALS, cache_key(PASSWORD))
+    return Account(USERNAME, PASSWORD, profile=PROFILE, cache=cache)
+
+
 async def resell(bot: Bot, moment: Moment, markup: int) -> Result:
     print(f'Reselling: {moment}')
     order = await bot.create_order(moment)
@@ -46,18 +74,46 @@ async def resell(bot: Bot, moment: Moment, markup: int) -> Result:
     return listing
 
 
+async def resell_many(bot: Bot, moments: List[Moment], markup: int) -> List[Result]:
+    engine = TradeEngine(bot)
+    results = await engine.run(moments, markup)
+    print(engine.report())
+    return results
+
+
+async def relist_collection(
+    bot: Bot, session: Session, owner_id: str, history: History, undercut: int = 1
+) -> Relister:
+    relister = Relister(bot, undercut_floor(history, undercut), limiter=session.limiter)
+    print(f'Queued {await relister.load(bot.iter_collection(owner_id, 1000))} moments')
+    await relister.run()
+    print(relister.report())
+    return relister
+
+
 async def start(session: Session, refresh_nba, refresh_flow):
+    captchas = await session.create_pool(KEY_API, KEY_SITE, 'https://www.nbatopshot.com/marketplace')
     bot = Bot(
         period=5,
-        solve_recaptcha=await session.create_solver(key_api=KEY_API, key_site=KEY_SITE),
-        call_nba=await session.create_caller(CALL_NBA, 'x-id-token', refresh_nba),
-        call_flow=await session.create_caller(CALL_DAPPER, 'Authorization', refresh_flow)
+        solve_recaptcha=captchas.take,
+        call_nba=await session.create_caller(CALL_NBA, 'x-id-token', refresh_nba, batch=True),
+        call_flow=await session.create_caller(CALL_DAPPER, 'Authorization', refresh_flow),
+        metrics=session.metrics
     )
-    plays = await bot.get_plays(batch=25)
-    for play in plays:
-        moments = await bot.get_moments(play)
-        for moment in moments:
-            print(moment)
+    await session.metrics.serve()
+    asyncio.create_task(session.metrics.dump('metrics.json'))
+    await asyncio.gather(session.warm(CALL_NBA), session.warm(CALL_DAPPER))
+    history = History()
+    book = MomentTable()
+    scanner = MarketScanner(bot, batch=25, concurrency=16, rate=20)
+    async for change in scanner.sweep():
+        print(change)
+        if change.moments is not None:
+            history.record_moments(change.play, change.moments)
+            book.extend(change.moments)
+    history.record_plays(scanner.snapshot.values())
+    for opportunity in score(book, history, count=10):
+        print(opportunity)
     # while True:
     #     try:
     #         moments = []
@@ -107,9 +163,7 @@ async def start(session: Session, refresh_nba, refresh_flow):
     # moment = collection[0]
     # if not (moment.price == 0):
     #     raise Exception('already listed!')
-    # listings = (await bot.get_moments(moment.play))[0:10]
-    # print('got listings')
-    # value = sum(map(lambda it: it.price, listings)) / 10
+    # value = history.valuation(moment.play, 10)
     # print(f'Value: {value}')
     # offer = await bot.create_offer(moment, value + 1)
     # print(f'Offer: {offer}')
@@ -120,11 +174,81 @@ async def start(session: Session, refresh_nba, refresh_flow):
 async def main():
     async def no_token() -> str:
         return ''
-    async with Session(PROXY) as session:
+    async with Session(PROXIES) as session:
+        session.operations.load_module(queries)
+        session.operations.load_directory(os.path.join(os.path.dirname(__file__), 'endpoints'))
         if not AUTHENTICATE:
             return await start(session, no_token, no_token)
-        async with Account(USERNAME, PASSWORD) as account:
-            await start(session, account.nba_token, account.flow_token)
+        async with account() as signed:
+            await start(session, signed.nba_token, signed.flow_token)
+
+async def main_sharded(markup: int = 1):
+    async def solver(session: Session):
+        return (await session.create_pool(KEY_API, KEY_SITE, 'https://www.nbatopshot.com/marketplace')).take
+    async with AsyncExitStack() as stack:
+        workers = [
+            await Worker.open(
+                stack, f'worker-{index}', proxy, CALL_NBA, CALL_DAPPER, solver,
+                *((username, password) if AUTHENTICATE else ())
+            ) for index, (username, password, proxy) in enumerate(ACCOUNTS)
+        ]
+        for worker in workers:
+            worker.session.operations.load_module(queries)
+        coordinator = Coordinator(workers)
+        buys = set()
+
+        async def buy(opportunity):
+            result = await coordinator.buy(opportunity.moment, markup)
+            print(f'{opportunity}: {result}')
+        async for worker, play, moments in coordinator.sweep():
+            print(f'{worker.name}: {play} - {len(moments)} listings')
+            for opportunity in score(MomentTable.of(moments), count=1):
+                task = asyncio.create_task(buy(opportunity))
+                buys.add(task)
+                task.add_done_callback(buys.discard)
+        await asyncio.gather(*buys)
+
+
+async def main_split(processes: int = None):
+    async def no_token() -> str:
+        return ''
+    async with Session(PROXIES) as session:
+        session.operations.load_module(queries)
+        pool = ScanPool(CALL_NBA, PROXIES, processes, history='history.db')
+        pool.start()
+        try:
+            async with account() as signed:
+                captchas = await session.create_pool(KEY_API, KEY_SITE, 'https://www.nbatopshot.com/marketplace')
+                bot = Bot(
+                    period=5,
+                    solve_recaptcha=captchas.take,
+                    call_nba=await session.create_caller(CALL_NBA, 'x-id-token', signed.nba_token),
+                    call_flow=await session.create_caller(CALL_DAPPER, 'Authorization', signed.flow_token),
+                    metrics=session.metrics
+                )
+                sniper = Sniper(bot)
+                await sniper.start()
+                snipes = set()
+
+                async def snipe(moment: Moment, seen: float):
+                    try:
+                        print(f'Snipe {moment}: {await sniper.snipe(moment, seen)}')
+                    except Exception as reason:
+                        print(f'Snipe {moment} failed: {reason}')
+                async for candidate in pool.candidates():
+                    moment, resale, profit, seen = decode(bot, candidate)
+                    age = time.time() - seen
+                    if age > STALE:
+                        print(f'Skipping {moment}: seen {age:.1f}s ago')
+                        continue
+                    print(f'+${profit:.2f} - {moment} - sell ${resale:.0f}')
+                    task = asyncio.create_task(snipe(moment, time.monotonic() - age))
+                    snipes.add(task)
+                    task.add_done_callback(snipes.discard)
+        finally:
+            pool.stop()
+
 
-asyncio.set_event_loop_policy(WindowsSelectorEventLoopPolicy())
-asyncio.run(main())
+if __name__ == '__main__':
+    asyncio.set_event_loop_policy(WindowsSelectorEventLoopPolicy())
+    asyncio.run(main())
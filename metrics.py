@@ -0,0 +1,189 @@
+import asyncio
+import functools
+import json
+import logging
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, List
+
+logger = logging.getLogger('topshot')
+
+LATENCY = [0.005 * 1.5 ** it for it in range(20)]
+
+
+class Histogram:
+    __slots__ = ('bounds', 'counts', 'count', 'sum')
+
+    def __init__(self, bounds: List[float] = None):
+        self.bounds = bounds or LATENCY
+        self.counts = [0] * (len(self.bounds) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float):
+        index = 0
+        for bound in self.bounds:
+            if value <= bound:
+                break
+            index += 1
+        self.counts[index] += 1
+        self.count += 1
+        self.sum += value
+
+    def quantile(self, q: float) -> float:
+        if self.count == 0:
+            return 0.0
+        target = q * self.count
+        seen = 0
+        for index, count in enumerate(self.counts):
+            if seen + count >= target and count:
+                low = self.bounds[index - 1] if index > 0 else 0.0
+                high = self.bounds[index] if index < len(self.bounds) else self.bounds[-1]
+                return low + (high - low) * (target - seen) / count
+            seen += count
+        return self.bounds[-1]
+
+    def summary(self) -> dict:
+        return {
+            'count': self.count,
+            'mean': self.sum / self.count if self.count else 0.0,
+            'p50': self.quantile(0.5),
+            'p95': self.quantile(0.95),
+            'p99': self.quantile(0.99),
+        }
+
+    def lines(self, name: str, labels: str) -> List[str]:
+        lines = []
+        total = 0
+        for bound, count in zip(self.bounds, self.counts):
+            total += count
+            lines.append(f'{name}_bucket{{{labels},le="{bound:g}"}} {total}')
+        lines.append(f'{name}_bucket{{{labels},le="+Inf"}} {self.count}')
+        lines.append(f'{name}_sum{{{labels}}} {self.sum:.6f}')
+        lines.append(f'{name}_count{{{labels}}} {self.count}')
+        return lines
+
+
+class OperationMetrics:
+    __slots__ = ('latency', 'calls', 'errors', 'retries', 'flared', 'sent', 'received', 'inflight')
+
+    def __init__(self):
+        self.latency = Histogram()
+        self.calls = 0
+        self.errors = 0
+        self.retries = 0
+        self.flared = 0
+        self.sent = 0
+        self.received = 0
+        self.inflight = 0
+
+    def summary(self) -> dict:
+        return {
+            'latency': self.latency.summary(),
+            'calls': self.calls,
+            'errors': self.errors,
+            'retries': self.retries,
+            'flared': self.flared,
+            'sent': self.sent,
+            'received': self.received,
+            'inflight': self.inflight,
+        }
+
+
+class Metrics:
+    def __init__(self):
+        self.operations: Dict[str, OperationMetrics] = {}
+        self.stages: Dict[str, Histogram] = {}
+        self.queues: Dict[str, Histogram] = {}
+        self.extras: Dict[str, Callable[[], dict]] = {}
+
+    def operation(self, name: str) -> OperationMetrics:
+        metrics = self.operations.get(name)
+        if metrics is None:
+            metrics = self.operations[name] = OperationMetrics()
+        return metrics
+
+    def queue(self, name: str) -> Histogram:
+        histogram = self.queues.get(name)
+        if histogram is None:
+            histogram = self.queues[name] = Histogram()
+        return histogram
+
+    @contextmanager
+    def stage(self, name: str):
+        histogram = self.stages.get(name)
+        if histogram is None:
+            histogram = self.stages[name] = Histogram()
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            histogram.observe(time.monotonic() - started)
+
+    def snapshot(self) -> dict:
+        return {
+            'time': time.time(),
+            'operations': {name: it.summary() for name, it in self.operations.items()},
+            'stages': {name: it.summary() for name, it in self.stages.items()},
+            'queues': {name: it.summary() for name, it in self.queues.items()},
+            **{name: summary() for name, summary in self.extras.items()},
+        }
+
+    def prometheus(self) -> str:
+        lines = ['# TYPE topshot_request_seconds histogram']
+        for name, it in self.operations.items():
+            lines.extend(it.latency.lines('topshot_request_seconds', f'operation="{name}"'))
+        counters = (
+            ('topshot_requests_total', 'counter', 'calls'),
+            ('topshot_errors_total', 'counter', 'errors'),
+            ('topshot_retries_total', 'counter', 'retries'),
+            ('topshot_cloudflare_total', 'counter', 'flared'),
+            ('topshot_request_bytes_total', 'counter', 'sent'),
+            ('topshot_response_bytes_total', 'counter', 'received'),
+            ('topshot_inflight', 'gauge', 'inflight'),
+        )
+        for metric, kind, field in counters:
+            lines.append(f'# TYPE {metric} {kind}')
+            for name, it in self.operations.items():
+                lines.append(f'{metric}{{operation="{name}"}} {getattr(it, field)}')
+        lines.append('# TYPE topshot_stage_seconds histogram')
+        for name, it in self.stages.items():
+            lines.extend(it.lines('topshot_stage_seconds', f'stage="{name}"'))
+        lines.append('# TYPE topshot_queue_seconds histogram')
+        for name, it in self.queues.items():
+            lines.extend(it.lines('topshot_queue_seconds', f'priority="{name}"'))
+        return '\n'.join(lines) + '\n'
+
+    async def serve(self, host: str = '127.0.0.1', port: int = 9108):
+        from aiohttp import web
+
+        async def handle(request):
+            return web.Response(text=self.prometheus(), content_type='text/plain')
+        app = web.Application()
+        app.router.add_get('/metrics', handle)
+        runner = web.AppRunner(app)
+        await runner.setup()
+        await web.TCPSite(runner, host, port).start()
+        return runner
+
+    async def dump(self, path: str, period: float = 10.0):
+        while True:
+            await asyncio.sleep(period)
+            snapshot = self.snapshot()
+            with open(path, 'w') as file:
+                json.dump(snapshot, file)
+            calls = sum(it.calls for it in self.operations.values())
+            failed = sum(it.errors + it.flared for it in self.operations.values())
+            logger.info('metrics', extra={'calls': calls, 'failed': failed})
+
+
+def timed(stage: str):
+    def decorate(method):
+        @functools.wraps(method)
+        async def wrapper(self, *args, **kwargs):
+            if self.metrics is None:
+                return await method(self, *args, **kwargs)
+            with self.metrics.stage(stage):
+                return await method(self, *args, **kwargs)
+        return wrapper
+    return decorate
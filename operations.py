@@ -0,0 +1,95 @@
+import hashlib
+import json
+import os
+import re
+from types import ModuleType
+from typing import Dict, Set
+
+PATTERN = re.compile(
+    r'\s*(?:(query|mutation|subscription)\s+)?(\w+)\s*(?:\([^)]*\))?\s*\{\s*(\w+)'
+)
+
+
+class Operation:
+    __slots__ = ('query', 'kind', 'name', 'field', 'hash', 'plain', 'full', 'hashed', 'registered')
+
+    def __init__(self, query: str):
+        match = PATTERN.match(query)
+        if match is None:
+            raise ValueError(f'Not a GraphQL operation: {query[:40]!r}')
+        self.query = query
+        self.kind = match.group(1) or 'query'
+        self.name = match.group(2)
+        self.field = match.group(3)
+        self.hash = hashlib.sha256(query.encode()).hexdigest()
+        persisted = {'persistedQuery': {'version': 1, 'sha256Hash': self.hash}}
+        self.plain = (
+            '{"operationName": ' + json.dumps(self.name) +
+            ', "query": ' + json.dumps(query) + ', "variables": '
+        ).encode()
+        self.full = (
+            '{"operationName": ' + json.dumps(self.name) +
+            ', "query": ' + json.dumps(query) +
+            ', "extensions": ' + json.dumps(persisted) + ', "variables": '
+        ).encode()
+        self.hashed = (
+            '{"operationName": ' + json.dumps(self.name) +
+            ', "extensions": ' + json.dumps(persisted) + ', "variables": '
+        ).encode()
+        self.registered: Set[str] = set()
+
+    @property
+    def mutation(self) -> bool:
+        return self.kind == 'mutation'
+
+    def body(self, variables: dict, persist: bool = False, registered: bool = False) -> bytes:
+        if not persist:
+            prefix = self.plain
+        elif registered:
+            prefix = self.hashed
+        else:
+            prefix = self.full
+        return prefix + json.dumps(variables).encode() + b'}'
+
+    def __str__(self):
+        return f'{self.kind} {self.name} -> {self.field}'
+
+
+class Registry:
+    def __init__(self):
+        self.operations: Dict[str, Operation] = {}
+        self.names: Dict[str, Operation] = {}
+
+    def register(self, query: str) -> Operation:
+        operation = self.operations.get(query)
+        if operation is None:
+            operation = Operation(query)
+            self.operations[query] = operation
+            self.names[operation.name] = operation
+        return operation
+
+    def get(self, query: str) -> Operation:
+        operation = self.operations.get(query)
+        if operation is None:
+            operation = self.register(query)
+        return operation
+
+    def named(self, name: str) -> Operation:
+        return self.names[name]
+
+    def load_module(self, module: ModuleType):
+        for key, value in vars(module).items():
+            if key.isupper() and isinstance(value, str) and PATTERN.match(value):
+                self.register(value)
+
+    def load_directory(self, directory: str):
+        for name in sorted(os.listdir(directory)):
+            if name.endswith('.gql'):
+                with open(os.path.join(directory, name)) as file:
+                    self.register(file.read())
+
+    def __iter__(self):
+        return iter(self.operations.values())
+
+    def __len__(self):
+        return len(self.operations)
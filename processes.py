@@ -0,0 +1,127 @@
+import asyncio
+import multiprocessing
+import time
+from multiprocessing.connection import Connection
+from typing import AsyncIterator, List, Optional, Tuple, Union
+
+from bot import Bot, Moment, Play
+from coordinator import position
+from history import History
+from scanner import MarketScanner
+from scoring import score
+from session import Session
+from table import MomentTable
+
+Candidate = Tuple[str, str, str, str, str, int, float, float, float]
+
+
+def encode(moment: Moment, resale: float, profit: float) -> Candidate:
+    return (
+        moment.play.set_id, moment.play.play_id, moment.moment_id, moment.flow_id,
+        moment.owner_id, moment.price, resale, profit, time.time()
+    )
+
+
+def decode(bot: Bot, candidate: Candidate) -> Tuple[Moment, float, float, float]:
+    set_id, play_id, moment_id, flow_id, owner_id, price, resale, profit, seen = candidate
+    moment = Moment(bot.play(set_id, play_id), moment_id, flow_id, owner_id, price)
+    return moment, resale, profit, seen
+
+
+class ShardScanner(MarketScanner):
+    def __init__(self, bot: Bot, shard: int, shards: int, **kwargs):
+        super().__init__(bot, **kwargs)
+        self.shard = shard
+        self.shards = shards
+
+    def owns(self, play: Play) -> bool:
+        return position(f'{play.set_id}/{play.play_id}') % self.shards == self.shard
+
+
+async def scan_forever(
+    connection: Connection, shard: int, shards: int, url: str, proxy: Union[str, List[str]],
+    period: float, history: Optional[str], fee: float
+):
+    async def no_token() -> str:
+        return ''
+
+    async def no_captcha(url: str) -> str:
+        return ''
+    async with Session(proxy) as session:
+        bot = Bot(
+            period=5, solve_recaptcha=no_captcha,
+            call_nba=await session.create_caller(url, 'x-id-token', no_token, batch=True),
+            call_flow=no_captcha, metrics=session.metrics
+        )
+        store = History(history) if history else None
+        scanner = ShardScanner(bot, shard, shards)
+        while True:
+            started = time.monotonic()
+            floors = store.rolling_floors(86400.0) if store is not None else None
+            async for change in scanner.sweep():
+                if not change.moments:
+                    continue
+                for opportunity in score(MomentTable.of(change.moments), count=1, fee=fee, floors=floors):
+                    connection.send(encode(opportunity.moment, opportunity.resale, opportunity.profit))
+            await asyncio.sleep(max(0.0, period - (time.monotonic() - started)))
+
+
+def run_scanner(*args):
+    asyncio.run(scan_forever(*args))
+
+
+class ScanPool:
+    def __init__(
+        self, url: str, proxy: Union[str, List[str]], processes: int = None, period: float = 5.0,
+        history: str = None, fee: float = 0.05
+    ):
+        self.url = url
+        self.proxy = proxy
+        self.count = processes or max(1, multiprocessing.cpu_count() - 1)
+        self.period = period
+        self.history = history
+        self.fee = fee
+        self.processes: List[multiprocessing.Process] = []
+        self.connections: List[Connection] = []
+
+    def start(self):
+        context = multiprocessing.get_context('spawn')
+        for shard in range(self.count):
+            reader, writer = context.Pipe(duplex=False)
+            process = context.Process(
+                target=run_scanner, daemon=True,
+                args=(writer, shard, self.count, self.url, self.proxy, self.period, self.history, self.fee)
+            )
+            process.start()
+            writer.close()
+            self.processes.append(process)
+            self.connections.append(reader)
+
+    def stop(self):
+        for process in self.processes:
+            process.terminate()
+        for process in self.processes:
+            process.join()
+        for connection in self.connections:
+            connection.close()
+        self.processes = []
+        self.connections = []
+
+    async def candidates(self) -> AsyncIterator[Candidate]:
+        loop = asyncio.get_event_loop()
+        queue = asyncio.Queue()
+
+        async def pump(connection: Connection):
+            while True:
+                try:
+                    candidate = await loop.run_in_executor(None, connection.recv)
+                except EOFError:
+                    return
+                await queue.put(candidate)
+        pumps = [asyncio.create_task(pump(connection)) for connection in self.connections]
+        try:
+            while True:
+                yield await queue.get()
+        finally:
+            for task in pumps:
+                task.cancel()
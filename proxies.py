@@ -0,0 +1,120 @@
+import random
+import time
+from typing import Dict, List, Optional
+from urllib.parse import unquote, urlsplit
+
+from aiohttp import BasicAuth
+
+from metrics import Histogram, logger
+
+
+class Proxy:
+    __slots__ = (
+        'url', 'auth', 'label', 'latency', 'histogram', 'errors', 'flares',
+        'failures', 'trips', 'until', 'probing', 'requests'
+    )
+
+    def __init__(self, url: Optional[str]):
+        self.url = None
+        self.auth = None
+        self.label = 'direct'
+        if url:
+            parts = urlsplit(url)
+            self.label = f'{parts.hostname}:{parts.port}' if parts.port else parts.hostname
+            self.url = f'{parts.scheme}://{self.label}'
+            if parts.username:
+                self.auth = BasicAuth(unquote(parts.username), unquote(parts.password or ''))
+        self.latency: Optional[float] = None
+        self.histogram = Histogram()
+        self.errors = 0.0
+        self.flares = 0.0
+        self.failures = 0
+        self.trips = 0
+        self.until = 0.0
+        self.probing = False
+        self.requests = 0
+
+    def __str__(self):
+        return self.label
+
+
+class ProxyPool:
+    def __init__(
+        self, proxies: List[str], threshold: int = 5, cooldown: float = 15.0,
+        ceiling: float = 300.0, weight: float = 0.1, hedge: float = 2.0, floor: float = 0.05
+    ):
+        self.proxies = [Proxy(it) for it in proxies if it] or [Proxy(None)]
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.ceiling = ceiling
+        self.weight = weight
+        self.hedge = hedge
+        self.floor = floor
+        self.hedged = 0
+
+    def score(self, proxy: Proxy) -> float:
+        known = [it.latency for it in self.proxies if it.latency is not None]
+        latency = proxy.latency if proxy.latency is not None else min(known, default=1.0)
+        return latency * (1.0 + 4.0 * proxy.flares + 2.0 * proxy.errors)
+
+    def available(self, proxy: Proxy, now: float) -> bool:
+        if proxy.failures < self.threshold:
+            return True
+        return proxy.until <= now and not proxy.probing
+
+    def choose(self, exclude: Proxy = None) -> Optional[Proxy]:
+        now = time.monotonic()
+        candidates = [it for it in self.proxies if it is not exclude and self.available(it, now)]
+        if not candidates:
+            if exclude is not None:
+                return None
+            return min(self.proxies, key=lambda it: it.until)
+        if len(candidates) > 2:
+            candidates = random.sample(candidates, 2)
+        proxy = min(candidates, key=self.score)
+        if proxy.failures >= self.threshold:
+            proxy.probing = True
+        return proxy
+
+    def delay(self, proxy: Proxy) -> float:
+        if not proxy.histogram.count:
+            return max(self.floor, self.hedge * 0.25)
+        return max(self.floor, self.hedge * proxy.histogram.quantile(0.5))
+
+    def succeeded(self, proxy: Proxy, latency: float):
+        proxy.requests += 1
+        proxy.histogram.observe(latency)
+        if proxy.latency is None:
+            proxy.latency = latency
+        else:
+            proxy.latency += self.weight * (latency - proxy.latency)
+        proxy.errors -= self.weight * proxy.errors
+        proxy.flares -= self.weight * proxy.flares
+        if proxy.failures >= self.threshold:
+            logger.info('proxy %s recovered', proxy)
+        proxy.failures = 0
+        proxy.trips = 0
+        proxy.probing = False
+
+    def failed(self, proxy: Proxy, flared: bool = False):
+        proxy.requests += 1
+        proxy.errors += self.weight * ((0.0 if flared else 1.0) - proxy.errors)
+        proxy.flares += self.weight * ((1.0 if flared else 0.0) - proxy.flares)
+        proxy.failures += 1
+        proxy.probing = False
+        if proxy.failures >= self.threshold:
+            proxy.trips += 1
+            opened = min(self.ceiling, self.cooldown * 2 ** min(proxy.trips - 1, 16))
+            proxy.until = time.monotonic() + opened
+            logger.warning('proxy %s failing, out of rotation for %.0fs', proxy, opened)
+
+    def summary(self) -> Dict[str, dict]:
+        now = time.monotonic()
+        return {it.label: {
+            'latency': it.latency,
+            'errors': it.errors,
+            'flares': it.flares,
+            'score': self.score(it),
+            'open': it.failures >= self.threshold and it.until > now,
+            'requests': it.requests,
+        } for it in self.proxies}
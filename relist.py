@@ -0,0 +1,211 @@
+import asyncio
+import sqlite3
+import time
+from typing import AsyncIterable, Callable, Iterable, List, Optional, Set, Tuple
+
+from bot import CREATE_OFFER, Bot, Moment, Offer
+from history import History
+from limiter import Backoff, RateLimiter
+from metrics import logger
+from operations import Operation
+from session import RateLimitException
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS relistings (
+    moment_id TEXT PRIMARY KEY,
+    set_id TEXT NOT NULL,
+    play_id TEXT NOT NULL,
+    flow_id TEXT NOT NULL,
+    owner_id TEXT NOT NULL,
+    price INTEGER NOT NULL,
+    state TEXT NOT NULL,
+    offer_id TEXT,
+    intent_id TEXT,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    due REAL NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS relistings_state ON relistings (state, due);
+"""
+
+PENDING = ('queued', 'offered', 'intent')
+
+OFFER = Operation(CREATE_OFFER).name
+
+Job = Tuple[str, str, str, str, str, int, str, Optional[str], Optional[str], int, float]
+
+
+def undercut_floor(history: History, undercut: int = 1, minimum: int = 1) -> Callable[[Moment], Optional[int]]:
+    def pricing(moment: Moment) -> Optional[int]:
+        floor = history.floor(moment.play)
+        if floor is None:
+            return None
+        return max(minimum, floor - undercut)
+    return pricing
+
+
+class Relister:
+    def __init__(
+        self, bot: Bot, pricing: Callable[[Moment], Optional[int]], path: str = 'relist.db',
+        concurrency: int = 8, retries: int = 3, backoff: Backoff = None,
+        limiter: RateLimiter = None, offering: int = 2
+    ):
+        self.bot = bot
+        self.pricing = pricing
+        self.limiter = limiter
+        self.offers = asyncio.Semaphore(offering)
+        self.db = sqlite3.connect(path)
+        self.db.execute('PRAGMA journal_mode=WAL')
+        self.db.execute('PRAGMA synchronous=NORMAL')
+        self.db.executescript(SCHEMA)
+        self.concurrency = concurrency
+        self.retries = retries
+        self.backoff = backoff or Backoff(base=2.0, cap=300.0)
+        self.resume = 0.0
+        self.active: Set[str] = set()
+        self.started: Optional[float] = None
+        self.listed = 0
+        self.failed = 0
+        self.limited = 0
+
+    def enqueue(self, moments: Iterable[Moment]) -> int:
+        rows = []
+        for moment in moments:
+            if moment.price > 0:
+                continue
+            price = self.pricing(moment)
+            if price is None:
+                continue
+            rows.append((
+                moment.moment_id, moment.play.set_id, moment.play.play_id,
+                moment.flow_id, moment.owner_id, price, 'queued'
+            ))
+        with self.db:
+            before = self.db.total_changes
+            self.db.executemany(
+                'INSERT OR IGNORE INTO relistings (moment_id, set_id, play_id, flow_id, owner_id, price, state) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?)', rows
+            )
+            return self.db.total_changes - before
+
+    async def load(self, moments: AsyncIterable[Moment], batch: int = 1000) -> int:
+        added = 0
+        chunk: List[Moment] = []
+        async for moment in moments:
+            chunk.append(moment)
+            if len(chunk) >= batch:
+                added += self.enqueue(chunk)
+                chunk = []
+        return added + self.enqueue(chunk)
+
+    def pending(self) -> int:
+        return self.db.execute(
+            'SELECT COUNT(*) FROM relistings WHERE state IN (?, ?, ?)', PENDING
+        ).fetchone()[0]
+
+    def ready(self) -> Optional[Job]:
+        now = time.time()
+        states = PENDING if now >= self.resume else PENDING[1:]
+        rows = self.db.execute(
+            f'SELECT * FROM relistings WHERE state IN ({",".join("?" * len(states))}) AND due <= ? '
+            "ORDER BY CASE state WHEN 'intent' THEN 0 WHEN 'offered' THEN 1 ELSE 2 END, due LIMIT ?",
+            (*states, now, len(self.active) + 1)
+        ).fetchall()
+        for row in rows:
+            if row[0] not in self.active:
+                return row
+        return None
+
+    def cooldown(self) -> float:
+        wait = self.resume - time.time()
+        if self.limiter is not None:
+            wait = max(wait, self.limiter.operation(OFFER).paused - time.monotonic())
+        return wait
+
+    def update(self, moment_id: str, state: str, **fields):
+        fields['state'] = state
+        with self.db:
+            self.db.execute(
+                f'UPDATE relistings SET {", ".join(f"{name} = ?" for name in fields)} WHERE moment_id = ?',
+                (*fields.values(), moment_id)
+            )
+
+    async def relist(self, job: Job):
+        moment_id, set_id, play_id, flow_id, owner_id, price, state, offer_id, intent_id, attempts, _ = job
+        moment = Moment(self.bot.play(set_id, play_id), moment_id, flow_id, owner_id, price)
+        try:
+            if state == 'queued':
+                async with self.offers:
+                    wait = self.cooldown()
+                    if wait > 0:
+                        self.resume = max(self.resume, time.time() + wait)
+                        return
+                    try:
+                        offer_id = await self.bot.place_offer(moment, price)
+                    except RateLimitException as reason:
+                        self.limited += 1
+                        self.resume = max(self.resume, time.time() + (reason.delay or 60.0))
+                        logger.info('listing cooldown', extra={'seconds': reason.delay})
+                        return
+                state = 'offered'
+                self.update(moment_id, state, offer_id=offer_id)
+            if state == 'offered':
+                intent_id = (await self.bot.wait_offer(offer_id)).intent_id
+                state = 'intent'
+                self.update(moment_id, state, intent_id=intent_id)
+            result = await self.bot.create_listing(Offer(offer_id, intent_id))
+        except Exception as reason:
+            attempts += 1
+            if attempts >= self.retries:
+                self.failed += 1
+                print(f'Relisting {moment} failed: {reason}')
+                self.update(moment_id, 'failed', attempts=attempts)
+            else:
+                self.update(moment_id, state, attempts=attempts, due=time.time() + self.backoff.delay(attempts))
+            return
+        if result:
+            self.listed += 1
+            self.update(moment_id, 'listed')
+        else:
+            self.failed += 1
+            self.update(moment_id, 'failed')
+
+    async def run(self, idle: float = 1.0):
+        self.started = time.monotonic()
+        slots = asyncio.Semaphore(self.concurrency)
+        tasks: Set[asyncio.Task] = set()
+
+        def finished(task: asyncio.Task, moment_id: str):
+            tasks.discard(task)
+            self.active.discard(moment_id)
+            slots.release()
+        try:
+            while True:
+                await slots.acquire()
+                job = self.ready()
+                if job is None:
+                    slots.release()
+                    if not tasks and not self.pending():
+                        break
+                    await asyncio.sleep(idle)
+                    continue
+                self.active.add(job[0])
+                task = asyncio.create_task(self.relist(job))
+                tasks.add(task)
+                task.add_done_callback(lambda it, moment_id=job[0]: finished(it, moment_id))
+        finally:
+            for task in list(tasks):
+                task.cancel()
+        logger.info('relisting done', extra={'listed': self.listed, 'failed': self.failed})
+
+    @property
+    def hourly(self) -> float:
+        if self.started is None:
+            return 0.0
+        return self.listed / max(time.monotonic() - self.started, 1e-9) * 3600
+
+    def report(self) -> str:
+        cooldown = max(0.0, self.resume - time.time())
+        return (
+            f'{self.listed} listed, {self.failed} failed, {self.pending()} pending, '
+            f'{self.hourly:.0f} listings/hour, {self.limited} rate limited, cooldown {cooldown:.0f}s'
+        )
@@ -0,0 +1,89 @@
+from enum import Enum
+from typing import AsyncIterator, Dict, List, Optional, Set, Tuple
+
+from bot import Bot, Moment, Play
+
+
+class Kind(Enum):
+    NEW = 1
+    DROPPED = 2
+    CHANGED = 3
+    RAISED = 4
+    GONE = 5
+
+
+class Change:
+    __slots__ = ('kind', 'play', 'previous', 'moments')
+
+    def __init__(self, kind: Kind, play: Play, previous: Optional[Play] = None, moments: List[Moment] = None):
+        self.kind = kind
+        self.play = play
+        self.previous = previous
+        self.moments = moments
+
+    def __str__(self):
+        before = f' (was ${self.previous.price})' if self.previous is not None else ''
+        return f'{self.kind.name}: {self.play}{before}'
+
+
+class MarketScanner:
+    def __init__(self, bot: Bot, batch: int = 75, concurrency: int = 16, rate: float = None):
+        self.bot = bot
+        self.batch = batch
+        self.concurrency = concurrency
+        self.rate = rate
+        self.snapshot: Dict[Tuple[str, str], Play] = {}
+        self.plays = 0
+        self.fetched = 0
+
+    def owns(self, play: Play) -> bool:
+        return True
+
+    @staticmethod
+    def classify(play: Play, previous: Optional[Play]) -> Optional[Kind]:
+        if previous is None:
+            return Kind.NEW
+        if play.price < previous.price:
+            return Kind.DROPPED
+        if play.high != previous.high:
+            return Kind.CHANGED
+        if play.price > previous.price:
+            return Kind.RAISED
+        return None
+
+    async def sweep(self) -> AsyncIterator[Change]:
+        current: Dict[Tuple[str, str], Play] = {}
+        kinds: Dict[Tuple[str, str], Kind] = {}
+        quiet: List[Change] = []
+        failed: Set[Tuple[str, str]] = set()
+
+        async def changed() -> AsyncIterator[Play]:
+            async for play in self.bot.iter_plays(self.batch):
+                if not self.owns(play):
+                    continue
+                key = (play.set_id, play.play_id)
+                current[key] = play
+                kind = self.classify(play, self.snapshot.get(key))
+                if kind is Kind.RAISED:
+                    quiet.append(Change(kind, play, self.snapshot[key]))
+                elif kind is not None:
+                    kinds[key] = kind
+                    yield play
+
+        self.fetched = 0
+        async for play, moments in self.bot.scan(changed(), self.concurrency, self.rate, failed):
+            self.fetched += 1
+            key = (play.set_id, play.play_id)
+            yield Change(kinds[key], play, self.snapshot.get(key), moments)
+        for change in quiet:
+            yield change
+        for key in failed:
+            if key in self.snapshot:
+                current[key] = self.snapshot[key]
+            else:
+                del current[key]
+        for key, play in self.snapshot.items():
+            if key not in current:
+                yield Change(Kind.GONE, play, play)
+        self.snapshot = current
+        self.plays = len(current)
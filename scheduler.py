@@ -0,0 +1,116 @@
+import asyncio
+import heapq
+import itertools
+from contextlib import asynccontextmanager
+from enum import IntEnum
+from typing import Dict, List, Tuple
+
+from operations import Operation
+
+
+class Priority(IntEnum):
+    CRITICAL = 0
+    POLL = 1
+    SCAN = 2
+
+
+PRIORITIES = {
+    'GetPurchase': Priority.CRITICAL,
+    'GetUserP2PPurchaseOrder': Priority.POLL,
+    'GetUserP2PListingOrder': Priority.POLL,
+    'GetMomentTransferRequest': Priority.POLL,
+    'getBalance': Priority.POLL,
+}
+
+
+def classify(operation: Operation, priorities: Dict[str, Priority] = None) -> Priority:
+    priority = (PRIORITIES if priorities is None else priorities).get(operation.name)
+    if priority is not None:
+        return priority
+    return Priority.CRITICAL if operation.mutation else Priority.SCAN
+
+
+class Shed(Exception):
+    pass
+
+
+class Scheduler:
+    def __init__(
+        self, capacity: int = 32, reserved: int = None, background: int = None,
+        patience: float = 10.0
+    ):
+        self.capacity = capacity
+        self.reserved = reserved if reserved is not None else max(1, capacity // 4)
+        self.background = background if background is not None else max(1, capacity // 8)
+        self.patience = patience
+        self.active: Dict[Priority, int] = {priority: 0 for priority in Priority}
+        self.waiting: List[Tuple[int, int, asyncio.Future]] = []
+        self.counter = itertools.count()
+        self.shed = 0
+
+    @property
+    def inflight(self) -> int:
+        return sum(self.active.values())
+
+    def pressed(self) -> bool:
+        if self.active[Priority.CRITICAL]:
+            return True
+        return any(entry[0] == Priority.CRITICAL and not entry[2].done() for entry in self.waiting)
+
+    def limit(self, priority: Priority) -> int:
+        if priority == Priority.CRITICAL:
+            return self.capacity
+        if priority == Priority.SCAN and self.pressed():
+            return min(self.background, self.capacity - self.reserved)
+        return self.capacity - self.reserved
+
+    def ahead(self, priority: Priority) -> bool:
+        return any(entry[0] <= priority and not entry[2].done() for entry in self.waiting)
+
+    async def acquire(self, priority: Priority):
+        if self.inflight < self.limit(priority) and not self.ahead(priority):
+            self.active[priority] += 1
+            return
+        future = asyncio.get_event_loop().create_future()
+        heapq.heappush(self.waiting, (priority, next(self.counter), future))
+        try:
+            if priority == Priority.SCAN and self.patience is not None:
+                await asyncio.wait_for(asyncio.shield(future), self.patience)
+            else:
+                await future
+        except asyncio.TimeoutError:
+            if future.done() and not future.cancelled():
+                return
+            future.cancel()
+            self.shed += 1
+            raise Shed(f'{priority.name.lower()} request shed after {self.patience}s')
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                self.release(priority)
+            else:
+                future.cancel()
+            raise
+
+    def release(self, priority: Priority):
+        self.active[priority] -= 1
+        self.wake()
+
+    def wake(self):
+        while self.waiting:
+            priority, _, future = self.waiting[0]
+            if future.done():
+                heapq.heappop(self.waiting)
+                continue
+            if self.inflight >= self.limit(priority):
+                return
+            heapq.heappop(self.waiting)
+            self.active[priority] += 1
+            future.set_result(None)
+
+    @asynccontextmanager
+    async def slot(self, priority: Priority):
+        await self.acquire(priority)
+        try:
+            yield
+        finally:
+            self.release(priority)
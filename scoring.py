@@ -0,0 +1,65 @@
+from typing import Dict, List, Tuple
+
+import numpy
+
+from bot import Moment
+from history import History
+from table import MomentTable
+
+
+class Opportunity:
+    __slots__ = ('moment', 'resale', 'floor', 'spread', 'profit')
+
+    def __init__(self, moment: Moment, resale: float, floor: float, spread: float, profit: float):
+        self.moment = moment
+        self.resale = resale
+        self.floor = floor
+        self.spread = spread
+        self.profit = profit
+
+    def __str__(self):
+        return f'+${self.profit:.2f} - buy {self.moment} - sell ${self.resale:.0f}'
+
+
+def score(
+    table: MomentTable, history: History = None, count: int = 10,
+    fee: float = 0.05, undercut: int = 1, window: float = 86400.0,
+    floors: Dict[Tuple[str, str], float] = None
+) -> List[Opportunity]:
+    if len(table) == 0:
+        return []
+    prices = table.prices
+    plays = table.play_indexes
+    order = numpy.lexsort((prices, plays))
+    plays = plays[order]
+    prices = prices[order].astype(numpy.float64)
+    starts = numpy.flatnonzero(numpy.r_[True, plays[1:] != plays[:-1]])
+    following = numpy.minimum(starts + 1, len(prices) - 1)
+    paired = (starts + 1 < len(prices)) & (plays[following] == plays[starts])
+    cheapest = prices[starts]
+    second = numpy.where(paired, prices[following], numpy.nan)
+    floor = numpy.full(len(starts), numpy.nan)
+    if floors is None and history is not None:
+        floors = history.rolling_floors(window)
+    if floors is not None:
+        indexes = plays[starts]
+        floor = numpy.array([
+            floors.get((table.plays[index].set_id, table.plays[index].play_id), numpy.nan)
+            for index in indexes
+        ], dtype=numpy.float64)
+    resale = numpy.fmin(second, floor) - undercut
+    profit = resale * (1 - fee) - cheapest
+    spread = second - cheapest
+    ranked = numpy.argsort(-numpy.nan_to_num(profit, nan=-numpy.inf), kind='stable')
+    results = []
+    for group in ranked[:count]:
+        if not profit[group] > 0:
+            break
+        results.append(Opportunity(
+            moment=table[int(order[starts[group]])],
+            resale=float(resale[group]),
+            floor=float(floor[group]),
+            spread=float(spread[group]),
+            profit=float(profit[group])
+        ))
+    return results
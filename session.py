@@ -1,113 +1,364 @@
 import asyncio
 import json
 import time
-from typing import Callable, Awaitable
+from contextlib import asynccontextmanager, nullcontext
+from typing import Callable, Awaitable, Dict, List, Optional, Set, Union
+from urllib.parse import urlsplit
 
-from aiohttp import ClientSession, ContentTypeError
-from pyppeteer.launcher import Launcher
-import os
+from aiohttp import ClientSession, ContentTypeError, TCPConnector
+
+from batching import Batcher, BatchRejected, unsupported
+from cache import ResponseCache
+from captcha import TokenPool, TwoCaptcha
+from decode import Decoder
+from limiter import RateLimiter
+from metrics import Metrics, logger
+from operations import Registry
+from proxies import Proxy, ProxyPool
+from scheduler import Priority, Scheduler, Shed, classify
+from tokens import TokenManager
+
+
+HEDGED = {'GetUserP2PPurchaseOrder', 'GetUserP2PListingOrder', 'GetPurchase'}
 
 
 class ResponseException(Exception):
+    def __init__(self, payload=None):
+        super().__init__(payload)
+        self.payload = payload
+
+    def __str__(self):
+        if isinstance(self.payload, str):
+            return self.payload
+        return json.dumps(self.payload, indent=3)
+
+
+class PersistedQueryNotFound(ResponseException):
     pass
 
+
+class RateLimitException(ResponseException):
+    def __init__(self, payload, delay: float = None, endpoint: bool = False):
+        super().__init__(payload)
+        self.delay = delay
+        self.endpoint = endpoint
+
+
+def cooldown(error: dict) -> Optional[float]:
+    extensions = error.get('extensions') or {}
+    if extensions.get('status_code') != 9:
+        return None
+    message = str(extensions.get('status_message', ''))
+    try:
+        return int(message.split('wait ')[1].split(' minutes')[0]) * 60.0
+    except (IndexError, ValueError):
+        return 60.0
+
+
+def retry_after(response) -> Optional[float]:
+    try:
+        return float(response.headers['Retry-After'])
+    except (KeyError, ValueError):
+        return None
+
+
+class ConnectorConfig:
+    def __init__(
+        self, limit: int = 100, limit_per_host: int = 32,
+        keepalive_timeout: float = 75.0, ttl_dns_cache: int = 600,
+        force_close: bool = False
+    ):
+        self.limit = limit
+        self.limit_per_host = limit_per_host
+        self.keepalive_timeout = keepalive_timeout
+        self.ttl_dns_cache = ttl_dns_cache
+        self.force_close = force_close
+
+    def connector(self) -> TCPConnector:
+        if self.force_close:
+            return TCPConnector(
+                limit=self.limit, limit_per_host=self.limit_per_host,
+                ttl_dns_cache=self.ttl_dns_cache, force_close=True
+            )
+        return TCPConnector(
+            limit=self.limit, limit_per_host=self.limit_per_host,
+            ttl_dns_cache=self.ttl_dns_cache, keepalive_timeout=self.keepalive_timeout
+        )
+
+
 class Session:
-    def __init__(self, proxy: str):
-        self.launcher = Launcher(ignoreDefaultArgs=True)
-        self.proxy = proxy
-        self.calls = 0
-        self.errors = 0
-        self.flared = 0
-        self.last = time.time()
+    def __init__(
+        self, proxy: Union[str, List[str]], config: ConnectorConfig = None, limiter: RateLimiter = None,
+        retries: int = 5, patience: float = 30.0, hedged: Set[str] = None
+    ):
+        self.proxies = ProxyPool([proxy] if isinstance(proxy, str) else proxy)
+        self.hedged = HEDGED if hedged is None else hedged
+        self.config = config or ConnectorConfig()
+        self.pools: Dict[str, ClientSession] = {}
+        self.schedulers: Dict[str, Scheduler] = {}
+        self.tokens: List[TokenManager] = []
+        self.batchers: List[Batcher] = []
+        self.solvers: List[TokenPool] = []
+        self.limiter = limiter or RateLimiter()
+        self.retries = retries
+        self.patience = patience
+        self.metrics = Metrics()
+        self.metrics.extras['proxies'] = self.proxies.summary
+        self.decoder = Decoder()
+        self.operations = Registry()
+        self.cache = ResponseCache(self.operations)
 
     async def __aenter__(self):
-        os.environ.setdefault('HTTP_PROXY', self.proxy)
-        os.environ.setdefault('HTTPS_PROXY', self.proxy)
-        self.http = ClientSession(trust_env=True)
-        os.environ.pop('HTTP_PROXY')
-        os.environ.pop('HTTPS_PROXY')
+        self.http = self.open_pool()
         return self
 
+    def open_pool(self) -> ClientSession:
+        return ClientSession(connector=self.config.connector())
+
+    def pool(self, url: str) -> ClientSession:
+        host = urlsplit(url).netloc
+        http = self.pools.get(host)
+        if http is None:
+            http = self.pools[host] = self.open_pool()
+        return http
+
+    def scheduler(self, url: str) -> Scheduler:
+        host = urlsplit(url).netloc
+        scheduler = self.schedulers.get(host)
+        if scheduler is None:
+            scheduler = self.schedulers[host] = Scheduler(self.config.limit_per_host)
+        return scheduler
+
+    async def warm(self, url: str, connections: int = 4):
+        http = self.pool(url)
+
+        async def touch(proxy: Proxy):
+            try:
+                async with http.head(url, proxy=proxy.url, proxy_auth=proxy.auth) as response:
+                    await response.read()
+            except Exception as reason:
+                logger.warning('warm failed via %s: %s', proxy.label, reason, extra={'url': url})
+        await asyncio.gather(*(
+            touch(proxy) for proxy in self.proxies.proxies for _ in range(connections)
+        ))
+
     async def create_caller(
         self, url: str, key: str,
         refresh: Callable[[], Awaitable[str]],
+        persist: bool = False, cached: bool = True,
+        batch: bool = False, size: int = 16, window: float = 0.005
     ) -> Callable[[str, dict], Awaitable[dict]]:
-        duration = 600
-        update = [0]
-        token = ['']
+        tokens = TokenManager(refresh)
+        tokens.start()
+        self.tokens.append(tokens)
+        http = self.pool(url)
+        scheduler = self.scheduler(url)
 
-        async def call(query: str, variables: dict) -> dict:
-            name = query.split('(', 1)[0].split(' ', 1)[1]
-            method = query.split('(', 2)[1].split('{')[1].lstrip()
-            if update[0] < time.time():
-                token[0] = await refresh()
-                update[0] = int(time.time()) + duration
+        @asynccontextmanager
+        async def admitted(priority: Priority, name: str = None, amount: float = 1.0):
+            queued = time.monotonic()
+            if name is not None:
+                paused = self.limiter.operation(name).paused - queued
+                if paused > self.patience:
+                    raise RateLimitException(f'{name} paused for {paused:.1f}s', paused)
+            await self.limiter.acquire(url, name, priority == Priority.CRITICAL, amount)
+            async with scheduler.slot(priority):
+                self.metrics.queue(priority.name.lower()).observe(time.monotonic() - queued)
+                yield
+
+        async def fetch(body: bytes, proxy: Proxy, batched: bool = False) -> bytes:
             headers = {
-                key: token[0],
+                key: await tokens.get(),
                 'content-type': 'application/json'
             }
-            body = {
-                'operationName': name,
-                'variables': variables,
-                'query': query
-            }
+            started = time.monotonic()
+            try:
+                async with http.post(
+                    url=url, headers=headers, data=body, proxy=proxy.url, proxy_auth=proxy.auth
+                ) as response:
+                    if response.status == 429:
+                        raise RateLimitException('Too many requests', retry_after(response), True)
+                    if batched and response.status == 400:
+                        raise BatchRejected(f'status {response.status}')
+                    raw = await response.read()
+                    if 'json' not in response.content_type:
+                        raise ContentTypeError(
+                            response.request_info, response.history,
+                            message=f'Unexpected content type {response.content_type}'
+                        )
+            except (RateLimitException, ContentTypeError):
+                self.proxies.failed(proxy, flared=True)
+                raise
+            except BatchRejected:
+                self.proxies.succeeded(proxy, time.monotonic() - started)
+                raise
+            except Exception:
+                self.proxies.failed(proxy)
+                raise
+            finally:
+                proxy.probing = False
+            self.proxies.succeeded(proxy, time.monotonic() - started)
+            return raw
+
+        async def post(body: bytes, batched: bool = False, hedge: bool = False) -> bytes:
+            proxy = self.proxies.choose()
+            if not hedge:
+                return await fetch(body, proxy, batched)
+            first = asyncio.ensure_future(fetch(body, proxy))
+            pending = {first}
             try:
-                # TODO move this stuff into bot or main.
-                self.calls += 1
-                lag = self.last - time.time()
-                if lag <= 0:
-                    self.last = time.time() + 10
-                    rate = 100 * float(self.errors + self.flared) / self.calls
-                    print(f'(({self.errors}, {self.flared}) / {self.calls}) - {rate:.2f}% - {abs(lag):.1f}s')
-                async with self.http.post(url=url, headers=headers, json=body) as response:
-                    data = await response.json()
-                    if 'error' in data:
-                        raise ResponseException(json.dumps(data['error'], indent=3))
-                    elif 'errors' in data:
-                        for error in data['errors']:
-                            raise ResponseException(json.dumps(error, indent=3))
-                    elif ('data' in data) and (method in data['data']):
-                        return data['data'][method]
-                    else:
-                        raise ResponseException(json.dumps(data, indent=3))
-            except ResponseException as reason:
-                raise reason
-            except ContentTypeError:
-                self.flared += 1
-                return await call(query, variables)
-            except Exception as e:
-                print(f'Reason: {e}')
-                self.errors += 1
-                return await call(query, variables)
+                done, _ = await asyncio.wait(pending, timeout=self.proxies.delay(proxy))
+                backup = None if done else self.proxies.choose(exclude=proxy)
+                if backup is not None:
+                    self.proxies.hedged += 1
+                    await self.limiter.endpoint(url).take()
+                    pending.add(asyncio.ensure_future(fetch(body, backup)))
+                while pending:
+                    done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                    for task in done:
+                        if task.exception() is None:
+                            return task.result()
+                return await first
+            finally:
+                for task in pending:
+                    task.cancel()
+
+        async def send(body: bytes, name: str, priority: Priority) -> dict:
+            async with admitted(Priority(priority)):
+                started = time.monotonic()
+                raw = await post(body)
+            self.limiter.endpoint(url).observe(time.monotonic() - started)
+            self.metrics.operation(name).received += len(raw)
+            return self.decoder.decode(raw, name)
+
+        async def send_many(bodies: List[bytes], names: List[str], priority: Priority) -> List[dict]:
+            async with admitted(Priority(priority)):
+                started = time.monotonic()
+                raw = await post(b'[' + b','.join(bodies) + b']', True)
+            self.limiter.endpoint(url).observe(time.monotonic() - started)
+            for name in names:
+                self.metrics.operation(name).received += len(raw) // len(names)
+            data = self.decoder.decode_many(raw, names)
+            if isinstance(data, dict):
+                if unsupported(data):
+                    raise BatchRejected(str(data)[:200])
+                return [data] * len(bodies)
+            if not isinstance(data, list) or len(data) != len(bodies):
+                raise BatchRejected(str(data)[:200])
+            return data
+
+        batcher = None
+        if batch:
+            batcher = Batcher(send, send_many, size, window)
+            self.batchers.append(batcher)
+
+        async def call(query: str, variables: dict) -> dict:
+            operation = self.operations.get(query)
+            method = operation.field
+            stats = self.metrics.operation(operation.name)
+            priority = classify(operation)
+            hedge = operation.name in self.hedged and len(self.proxies.proxies) > 1
+            attempt = 0
+            while True:
+                batched = batcher is not None and batcher.size > 1 and not operation.mutation and not hedge
+                registered = url in operation.registered
+                body = operation.body(variables, persist, registered)
+                if batched:
+                    await self.limiter.operation(operation.name).acquire(1.0 / batcher.size)
+                    admission = nullcontext()
+                else:
+                    admission = admitted(priority, operation.name)
+                async with admission:
+                    started = time.monotonic()
+                    stats.calls += 1
+                    stats.sent += len(body)
+                    stats.inflight += 1
+                    try:
+                        if batched:
+                            data = await batcher.submit(body, operation.name, priority)
+                        else:
+                            raw = await post(body, hedge=hedge)
+                            stats.received += len(raw)
+                            data = self.decoder.decode(raw, operation.name)
+                        if 'error' in data:
+                            raise ResponseException(data['error'])
+                        elif 'errors' in data:
+                            for error in data['errors']:
+                                if error.get('message') == 'PersistedQueryNotFound':
+                                    raise PersistedQueryNotFound(operation.name)
+                                delay = cooldown(error)
+                                if delay is not None:
+                                    raise RateLimitException(error, delay)
+                                raise ResponseException(error)
+                        elif ('data' in data) and (method in data['data']):
+                            self.limiter.succeeded(url, operation.name, None if batched else time.monotonic() - started)
+                            if persist:
+                                operation.registered.add(url)
+                            return data['data'][method]
+                        else:
+                            raise ResponseException(data)
+                    except PersistedQueryNotFound:
+                        operation.registered.discard(url)
+                        if attempt >= self.retries:
+                            raise ResponseException(f'{operation.name}: persisted query not found after {attempt + 1} attempts')
+                        attempt += 1
+                        stats.retries += 1
+                        continue
+                    except BatchRejected:
+                        continue
+                    except Shed:
+                        raise
+                    except RateLimitException as reason:
+                        if reason.endpoint:
+                            self.limiter.throttled(url, reason.delay, attempt)
+                        else:
+                            self.limiter.cooldown(operation.name, reason.delay)
+                        if attempt >= self.retries or (reason.delay or 0) > self.patience:
+                            raise reason
+                        attempt += 1
+                        stats.retries += 1
+                        continue
+                    except ResponseException as reason:
+                        raise reason
+                    except ContentTypeError:
+                        stats.flared += 1
+                        logger.debug('cloudflare', extra={'operation': operation.name, 'attempt': attempt})
+                        if attempt >= self.retries:
+                            raise ResponseException(f'{operation.name}: blocked after {attempt + 1} attempts')
+                    except Exception as e:
+                        stats.errors += 1
+                        logger.warning('request failed: %s', e, extra={'operation': operation.name, 'attempt': attempt})
+                        if attempt >= self.retries:
+                            raise ResponseException(f'{operation.name}: failed after {attempt + 1} attempts: {e}')
+                    finally:
+                        stats.inflight -= 1
+                        stats.latency.observe(time.monotonic() - started)
+                await self.limiter.backoff.sleep(attempt)
+                attempt += 1
+                stats.retries += 1
+        if cached:
+            return self.cache.wrap(call, url)
         return call
 
     async def create_solver(self, key_api: str, key_site: str) -> Callable[[str], Awaitable[str]]:
-        async def solve(url: str):
-            params = {
-                'key': key_api,
-                'method': 'userrecaptcha',
-                'action': 'verify',
-                'version': 'v3',
-                'googlekey': key_site,
-                'pageurl': url,
-                'json': '1'
-            }
-            try:
-                async with self.http.get('http://CAPTCHA SOLVER.com/in.php', params=params) as response:
-                    token = (await response.json())['request']
-                    while True:
-                        data = {'key': key_api, 'action': 'get', 'json': '1', 'id': token}
-                        async with self.http.get('http://2captcha.com/res.php', params=data) as check:
-                            data = await check.json()
-                            if data['status'] == 1:
-                                return data['request']
-                        await asyncio.sleep(15)
-            except Exception as reason:
-                print(f'Reason: {reason}')
-        return solve
+        return TwoCaptcha(self.http, key_api, key_site).solve
+
+    async def create_pool(
+        self, key_api: str, key_site: str, url: str, size: int = 3, solver=None
+    ) -> TokenPool:
+        pool = TokenPool(solver or TwoCaptcha(self.http, key_api, key_site), url, size)
+        pool.start()
+        self.solvers.append(pool)
+        return pool
 
     async def __aexit__(self, exc_type, exc_val, exc_tb):
         await self.close()
 
     async def close(self):
+        for pool in self.solvers:
+            await pool.stop()
+        for tokens in self.tokens:
+            await tokens.stop()
+        for http in self.pools.values():
+            await http.close()
         await self.http.close()
@@ -0,0 +1,90 @@
+import asyncio
+import time
+from typing import List, Optional, Tuple
+
+from bot import Bot, Moment, Order, Payment, Result, CHECK_ORDER, GET_BALANCE
+from engine import CreditBudget
+from session import ResponseException
+
+
+class Timeline:
+    def __init__(self, moment: Moment, started: float = None):
+        self.moment = moment
+        self.started = started or time.monotonic()
+        self.steps: List[Tuple[str, float]] = []
+
+    def mark(self, step: str):
+        self.steps.append((step, time.monotonic() - self.started))
+
+    def __str__(self):
+        steps = ' '.join(f'{step}+{offset * 1000:.0f}ms' for step, offset in self.steps)
+        return f'{self.moment}: {steps}'
+
+
+class Sniper:
+    def __init__(self, bot: Bot, budget: CreditBudget = None, interval: float = 0.25):
+        self.bot = bot
+        self.budget = budget or CreditBudget(lambda: bot.call_flow(GET_BALANCE, {}))
+        self.interval = interval
+        self.refresher: Optional[asyncio.Task] = None
+
+    async def start(self):
+        await self.budget.refresh()
+        self.refresher = asyncio.create_task(self.refresh())
+
+    async def stop(self):
+        if self.refresher is not None:
+            self.refresher.cancel()
+            self.refresher = None
+
+    async def refresh(self):
+        while True:
+            await asyncio.sleep(self.budget.ttl / 2)
+            try:
+                await self.budget.refresh()
+            except Exception as reason:
+                print(f'Reason: {reason}')
+
+    async def wait_intent(self, order_id: str) -> str:
+        while True:
+            try:
+                data = (await self.bot.call_nba(CHECK_ORDER, {'order_id': order_id}))['data']
+                if data['state'] == 'CREATE_INTENT_SUCCEEDED':
+                    return data['purchaseIntentID']
+                if data['state'] == 'PURCHASE_FAILED':
+                    raise Exception('Purchase failed!')
+            except ResponseException:
+                pass
+            await asyncio.sleep(self.interval)
+
+    async def snipe(self, moment: Moment, seen: float = None) -> Result:
+        timeline = Timeline(moment, seen)
+        if not await self.budget.reserve(moment.price):
+            print(f'Out of Dapper credits for {moment}')
+            return Result.FAILED
+        timeline.mark('reserved')
+        try:
+            order_id = await self.bot.place_order(moment)
+            timeline.mark('ordered')
+            order = Order(order_id, await self.wait_intent(order_id))
+            timeline.mark('intent')
+            option = await self.bot.get_payment_option(order)
+            timeline.mark('options')
+            if option['amount'] > self.budget.balance:
+                raise Exception('Out of Dapper credits!')
+            payment = Payment(order, option['id'])
+            await self.bot.confirm_purchase(payment, self.interval)
+            timeline.mark('confirmed')
+            result = await self.bot.wait_purchase(payment)
+        except Exception:
+            self.budget.release(moment.price)
+            timeline.mark('failed')
+            print(timeline)
+            raise
+        if result is Result.SUCCESSFUL:
+            self.budget.spend(moment.price)
+        else:
+            self.budget.release(moment.price)
+        timeline.mark('settled')
+        print(timeline)
+        return result
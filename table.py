@@ -0,0 +1,121 @@
+from array import array
+from typing import Dict, Iterable, Iterator, List, Tuple
+
+import numpy
+
+from bot import Moment, Play
+
+
+class StringTable:
+    __slots__ = ('strings', 'codes')
+
+    def __init__(self):
+        self.strings: List[str] = []
+        self.codes: Dict[str, int] = {}
+
+    def code(self, string: str) -> int:
+        code = self.codes.get(string)
+        if code is None:
+            code = len(self.strings)
+            self.codes[string] = code
+            self.strings.append(string)
+        return code
+
+    def __getitem__(self, code: int) -> str:
+        return self.strings[code]
+
+    def __len__(self):
+        return len(self.strings)
+
+
+class MomentTable:
+    def __init__(self):
+        self.plays: List[Play] = []
+        self.indexes: Dict[Tuple[str, str], int] = {}
+        self.ids = StringTable()
+        self.flows = StringTable()
+        self.owners = StringTable()
+        self.price_column = array('q')
+        self.play_column = array('l')
+        self.id_column = array('l')
+        self.flow_column = array('l')
+        self.owner_column = array('l')
+
+    @staticmethod
+    def of(moments: Iterable[Moment]) -> 'MomentTable':
+        table = MomentTable()
+        table.extend(moments)
+        return table
+
+    def play_index(self, play: Play) -> int:
+        key = (play.set_id, play.play_id)
+        index = self.indexes.get(key)
+        if index is None:
+            index = len(self.plays)
+            self.indexes[key] = index
+            self.plays.append(play)
+        return index
+
+    def append(self, moment: Moment):
+        self.price_column.append(moment.price)
+        self.play_column.append(self.play_index(moment.play))
+        self.id_column.append(self.ids.code(moment.moment_id))
+        self.flow_column.append(self.flows.code(moment.flow_id))
+        self.owner_column.append(self.owners.code(moment.owner_id))
+
+    def extend(self, moments: Iterable[Moment]):
+        for moment in moments:
+            self.append(moment)
+
+    def __len__(self):
+        return len(self.price_column)
+
+    def __getitem__(self, row: int) -> Moment:
+        return Moment(
+            play=self.plays[self.play_column[row]],
+            moment_id=self.ids[self.id_column[row]],
+            flow_id=self.flows[self.flow_column[row]],
+            owner_id=self.owners[self.owner_column[row]],
+            price=self.price_column[row]
+        )
+
+    def __iter__(self) -> Iterator[Moment]:
+        for row in range(len(self)):
+            yield self[row]
+
+    @property
+    def prices(self) -> numpy.ndarray:
+        return numpy.frombuffer(self.price_column, dtype=numpy.int64)
+
+    @property
+    def play_indexes(self) -> numpy.ndarray:
+        return numpy.frombuffer(self.play_column, dtype=numpy.dtype(f'i{self.play_column.itemsize}'))
+
+    def rows(self, rows: numpy.ndarray) -> List[Moment]:
+        return [self[int(row)] for row in rows]
+
+    def where(self, low: int = None, high: int = None, play: Play = None) -> numpy.ndarray:
+        prices = self.prices
+        mask = numpy.ones(len(prices), dtype=bool)
+        if low is not None:
+            mask &= prices >= low
+        if high is not None:
+            mask &= prices <= high
+        if play is not None:
+            index = self.indexes.get((play.set_id, play.play_id))
+            if index is None:
+                return numpy.empty(0, dtype=numpy.intp)
+            mask &= self.play_indexes == index
+        return numpy.flatnonzero(mask)
+
+    def sorted(self, rows: numpy.ndarray = None) -> numpy.ndarray:
+        if rows is None:
+            return numpy.argsort(self.prices, kind='stable')
+        return rows[numpy.argsort(self.prices[rows], kind='stable')]
+
+    def cheapest(self, count: int, low: int = None, high: int = None, play: Play = None) -> List[Moment]:
+        rows = self.where(low, high, play)
+        if count < len(rows):
+            prices = self.prices[rows]
+            rows = rows[numpy.argpartition(prices, count)[:count]]
+        return self.rows(self.sorted(rows))
@@ -0,0 +1,82 @@
+import asyncio
+import base64
+import json
+import time
+from typing import Awaitable, Callable, Optional
+
+
+def expiry(token: str) -> Optional[float]:
+    try:
+        payload = token.split('.')[1]
+        payload += '=' * (-len(payload) % 4)
+        return float(json.loads(base64.urlsafe_b64decode(payload))['exp'])
+    except Exception:
+        return None
+
+
+class TokenManager:
+    def __init__(
+        self, refresh: Callable[[], Awaitable[str]],
+        margin: float = 60.0, duration: float = 600.0
+    ):
+        self.refresh = refresh
+        self.margin = margin
+        self.duration = duration
+        self.token = ''
+        self.expires = 0.0
+        self.pending: Optional[asyncio.Task] = None
+        self.loop: Optional[asyncio.Task] = None
+
+    @property
+    def valid(self) -> bool:
+        return time.time() < self.expires
+
+    @property
+    def stale(self) -> bool:
+        return time.time() >= self.expires - self.margin
+
+    async def get(self) -> str:
+        if not self.valid:
+            return await self.renew()
+        if self.stale:
+            self.start_renewal()
+        return self.token
+
+    def start_renewal(self) -> asyncio.Task:
+        if self.pending is None:
+            self.pending = asyncio.create_task(self.fetch())
+        return self.pending
+
+    async def renew(self) -> str:
+        return await asyncio.shield(self.start_renewal())
+
+    async def fetch(self) -> str:
+        try:
+            token = await self.refresh()
+            self.token = token
+            self.expires = expiry(token) or time.time() + self.duration
+            return token
+        finally:
+            self.pending = None
+
+    def start(self):
+        if self.loop is None:
+            self.loop = asyncio.create_task(self.run())
+
+    async def run(self):
+        while True:
+            if self.stale:
+                try:
+                    await self.renew()
+                except Exception as reason:
+                    print(f'Reason: {reason}')
+                    await asyncio.sleep(5)
+                    continue
+            await asyncio.sleep(max(1.0, self.expires - self.margin - time.time()))
+
+    async def stop(self):
+        if self.loop is not None:
+            self.loop.cancel()
+            self.loop = None
+        if self.pending is not None:
+            self.pending.cancel()
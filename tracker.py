@@ -0,0 +1,106 @@
+import asyncio
+import json
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+
+class Watch:
+    def __init__(self, query: str, variables: dict):
+        self.query = query
+        self.variables = variables
+        self.last: Optional[dict] = None
+        self.waiters: List[Tuple[Callable[[dict], bool], asyncio.Future]] = []
+
+
+class StatusTracker:
+    def __init__(
+        self, poll: Callable[[str, dict], Awaitable[dict]],
+        fast: float = 0.5, slow: float = 5.0, growth: float = 2.0
+    ):
+        self.poll = poll
+        self.fast = fast
+        self.slow = slow
+        self.growth = growth
+        self.interval = fast
+        self.watches: Dict[str, Watch] = {}
+        self.wake: Optional[asyncio.Event] = None
+        self.task: Optional[asyncio.Task] = None
+
+    @staticmethod
+    def key(query: str, variables: dict) -> str:
+        return query + json.dumps(variables, sort_keys=True)
+
+    async def wait(self, query: str, variables: dict, done: Callable[[dict], bool]) -> dict:
+        key = self.key(query, variables)
+        watch = self.watches.get(key)
+        if watch is None:
+            watch = self.watches[key] = Watch(query, variables)
+        future = asyncio.get_event_loop().create_future()
+        watch.waiters.append((done, future))
+        if watch.last is not None:
+            self.update(key, watch, watch.last)
+        self.hurry()
+        try:
+            return await future
+        finally:
+            if not future.done():
+                watch.waiters.remove((done, future))
+                if not watch.waiters and self.watches.get(key) is watch:
+                    del self.watches[key]
+
+    def hurry(self):
+        if self.wake is None:
+            self.wake = asyncio.Event()
+        self.interval = self.fast
+        self.wake.set()
+        if self.watches and (self.task is None or self.task.done()):
+            self.task = asyncio.create_task(self.run())
+
+    def push(self, query: str, variables: dict, response: dict):
+        key = self.key(query, variables)
+        watch = self.watches.get(key)
+        if watch is not None and self.update(key, watch, response):
+            self.interval = self.fast
+
+    def update(self, key: str, watch: Watch, response: dict) -> bool:
+        changed = response != watch.last
+        watch.last = response
+        for waiter in list(watch.waiters):
+            done, future = waiter
+            if future.done():
+                watch.waiters.remove(waiter)
+                continue
+            try:
+                finished = done(response)
+            except Exception as reason:
+                future.set_exception(reason)
+                watch.waiters.remove(waiter)
+                continue
+            if finished:
+                future.set_result(response)
+                watch.waiters.remove(waiter)
+        if not watch.waiters and self.watches.get(key) is watch:
+            del self.watches[key]
+        return changed
+
+    async def check(self, key: str, watch: Watch) -> bool:
+        try:
+            response = await self.poll(watch.query, watch.variables)
+        except Exception as reason:
+            print(f'Reason: {reason}')
+            return False
+        return self.update(key, watch, response)
+
+    async def run(self):
+        while self.watches:
+            self.wake.clear()
+            changes = await asyncio.gather(*(
+                self.check(key, watch) for key, watch in list(self.watches.items())
+            ))
+            if any(changes):
+                self.interval = self.fast
+            else:
+                self.interval = min(self.slow, self.interval * self.growth)
+            try:
+                await asyncio.wait_for(self.wake.wait(), self.interval)
+            except asyncio.TimeoutError:
+                pass